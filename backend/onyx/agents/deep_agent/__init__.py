@@ -2,12 +2,20 @@
 Deep Agent implementation based on LangChain's deep-agents architecture.
 Provides enhanced capabilities for complex, multi-step tasks with planning,
 sub-agents, and virtual memory management.
+
+Submodules are imported lazily on first attribute access so that importing the
+package (e.g. for the integration layer) does not pull in the full agent stack
+on requests that never use it.
 """
 
-from onyx.agents.deep_agent.core import DeepAgent
-from onyx.agents.deep_agent.memory import VirtualFileSystem
-from onyx.agents.deep_agent.planning import TodoList
-from onyx.agents.deep_agent.sub_agents import SubAgentManager
+from importlib import import_module
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from onyx.agents.deep_agent.core import DeepAgent
+    from onyx.agents.deep_agent.memory import VirtualFileSystem
+    from onyx.agents.deep_agent.planning import TodoList
+    from onyx.agents.deep_agent.sub_agents import SubAgentManager
 
 __all__ = [
     "DeepAgent",
@@ -15,3 +23,20 @@ __all__ = [
     "TodoList",
     "SubAgentManager",
 ]
+
+_LAZY_IMPORTS = {
+    "DeepAgent": "onyx.agents.deep_agent.core",
+    "VirtualFileSystem": "onyx.agents.deep_agent.memory",
+    "TodoList": "onyx.agents.deep_agent.planning",
+    "SubAgentManager": "onyx.agents.deep_agent.sub_agents",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_path = _LAZY_IMPORTS.get(name)
+    if module_path is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(module_path), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,72 @@
+"""
+LLM response caching for Deep Agent planning and synthesis prompts.
+"""
+
+import abc
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def prompt_cache_key(prompt: str) -> str:
+    """Build an exact-match cache key for a prompt."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache(abc.ABC):
+    """
+    Interface for caching LLM responses keyed on the prompt and the model identity.
+    Implementations may match exactly on the prompt key or do a similarity search.
+    """
+
+    @abc.abstractmethod
+    async def alookup(self, prompt_key: str, llm_string: str) -> Optional[str]:
+        """Return the cached response text, or None on a miss."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def aupdate(self, prompt_key: str, llm_string: str, response: str) -> None:
+        """Store the response text for a prompt."""
+        raise NotImplementedError
+
+
+class InMemoryLLMResponseCache(LLMResponseCache):
+    """
+    Process-local exact-match LRU cache.
+    Safe to share between threads, each running its own event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def alookup(self, prompt_key: str, llm_string: str) -> Optional[str]:
+        key = (llm_string, prompt_key)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+        return response
+
+    async def aupdate(self, prompt_key: str, llm_string: str, response: str) -> None:
+        key = (llm_string, prompt_key)
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_shared_cache: Optional[InMemoryLLMResponseCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_response_cache() -> InMemoryLLMResponseCache:
+    """Return the process-wide in-memory cache, creating it on first use."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = InMemoryLLMResponseCache()
+        return _shared_cache
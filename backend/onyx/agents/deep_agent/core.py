@@ -3,22 +3,61 @@ Core Deep Agent implementation that orchestrates planning, sub-agents, and memor
 """
 
 import asyncio
-import json
-from typing import Any, Dict, List, Optional, Iterator
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional
+from collections.abc import AsyncIterator
 from datetime import datetime
+import orjson
 from pydantic import BaseModel, Field
 
-from onyx.agents.deep_agent.planning import TodoList, TaskPriority, TaskStatus
+from onyx.agents.deep_agent.cache import (
+    LLMResponseCache,
+    get_shared_response_cache,
+    prompt_cache_key,
+)
+from onyx.agents.deep_agent.planning import TodoItem, TodoList, TaskPriority, TaskStatus
 from onyx.agents.deep_agent.memory import VirtualFileSystem
 from onyx.agents.deep_agent.sub_agents import SubAgentManager, SubAgentType
-from onyx.agents.deep_agent.prompts import DEEP_AGENT_SYSTEM_PROMPT, PLANNING_PROMPT
-from onyx.chat.models import AnswerStream
+from onyx.agents.deep_agent import prompts
 from onyx.llm.interfaces import LLM
 from onyx.tools.tool import Tool
 from onyx.utils.logger import setup_logger
 
 logger = setup_logger()
 
+_LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize to compact JSON, falling back to str() for unsupported types."""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _text(response: Any) -> str:
+    """Extract the text of an LLM message, falling back to str() for plain values."""
+    content = getattr(response, "content", None)
+    return content if content is not None else str(response)
+
+
+# A bulleted or numbered plan line; group 1 is the task text without its marker
+_TASK_LINE_RE = re.compile(
+    r"^\s*[-*\d][-*\d. \t]*([^-*\d.\s].*?)[ \t\r]*$", re.MULTILINE
+)
+# The keyword patterns below are matched against lowercased text. Keeping them
+# case-sensitive lets the regex engine prefilter on the keywords' first characters.
+# Task titles that warrant spawning a research sub-agent
+_SUBAGENT_RE = re.compile(r"research|analyze|investigate|explore|deep dive")
+# Priority hints in planned task descriptions
+_PRIO_HIGH_RE = re.compile(r"critical|urgent|important")
+_PRIO_LOW_RE = re.compile(r"optional|nice to have")
+
 
 class DeepAgentConfig(BaseModel):
     """Configuration for Deep Agent."""
@@ -28,6 +67,17 @@ class DeepAgentConfig(BaseModel):
     max_sub_agents: int = Field(default=5, description="Maximum concurrent sub-agents")
     max_iterations: int = Field(default=20, description="Maximum iterations for task completion")
     verbose: bool = Field(default=False, description="Enable verbose logging")
+    sub_agent_timeout_seconds: float = Field(default=300, description="Timeout for a single sub-agent run")
+    enable_response_cache: bool = Field(
+        default=False, description="Cache planning and synthesis LLM responses"
+    )
+    response_cache: Optional[LLMResponseCache] = Field(
+        default=None,
+        description="Cache used when enable_response_cache is set; defaults to a process-wide in-memory cache"
+    )
+    
+    class Config:
+        arbitrary_types_allowed = True
     
 
 class DeepAgentState(BaseModel):
@@ -59,16 +109,43 @@ class DeepAgent:
         # Initialize components
         self.todo_list = TodoList() if self.config.enable_planning else None
         self.filesystem = VirtualFileSystem() if self.config.enable_memory else None
-        self.sub_agent_manager = SubAgentManager(self.filesystem) if self.config.enable_sub_agents else None
+        self.sub_agent_manager = self._create_sub_agent_manager() if self.config.enable_sub_agents else None
+        
+        self._response_cache: Optional[LLMResponseCache] = None
+        if self.config.enable_response_cache:
+            self._response_cache = self.config.response_cache or get_shared_response_cache()
         
         self.state: Optional[DeepAgentState] = None
         self.current_iteration = 0
+        # Per-request sampling override, part of the response cache key
+        self._temperature_override: Optional[float] = None
+        # Monotonic start of the current run, used for elapsed-time reporting
+        self._t0 = time.monotonic()
+        
+        # Ready tasks are independent, so they run concurrently up to max_sub_agents.
+        # TodoList updates from interleaved tasks are serialized through the lock.
+        self._sem = asyncio.Semaphore(self.config.max_sub_agents)
+        self._todo_lock = asyncio.Lock()
+        
+        # Per-iteration progress snapshots, flushed to memory once per run
+        self._progress_buf: List[Dict[str, Any]] = []
+        # Completed tasks evicted from the TODO list during the run
+        self._completed_log: List[TodoItem] = []
+        
+    def _create_sub_agent_manager(self) -> SubAgentManager:
+        """Build a sub-agent manager sized to max_sub_agents."""
+        # Only research agents are spawned, so one type may use every slot
+        return SubAgentManager(
+            self.filesystem,
+            max_concurrency=self.config.max_sub_agents,
+            max_concurrency_per_type=self.config.max_sub_agents
+        )
         
     def _log(self, message: str, level: str = "info"):
-        """Log a message with appropriate level."""
-        if self.config.verbose or level in ["error", "warning"]:
-            logger_func = getattr(logger, level, logger.info)
-            logger_func(f"[DeepAgent] {message}")
+        """Log a message with appropriate level. Only warnings and errors are logged unless verbose."""
+        if not self.config.verbose and level not in ("warning", "error"):
+            return
+        logger.log(_LOG_LEVELS.get(level, logging.INFO), "[DeepAgent] %s", message)
             
     def _save_to_memory(self, path: str, content: str) -> bool:
         """Save content to virtual memory if enabled."""
@@ -82,42 +159,117 @@ class DeepAgent:
             return self.filesystem.read_file(path)
         return None
     
+    def _flush_progress(self):
+        """Write buffered progress snapshots to memory as a single JSON Lines file."""
+        if not self._progress_buf:
+            return
+        
+        self._save_to_memory(
+            "/research/progress.jsonl",
+            "\n".join(_dumps(entry) for entry in self._progress_buf)
+        )
+        self._progress_buf = []
+    
+    async def _ainvoke(self, prompt: str) -> str:
+        """
+        Invoke the LLM without blocking the event loop and return the response text.
+        The LLM interface is synchronous, so the call runs in a worker thread
+        while concurrently executing tasks keep making progress.
+        """
+        return _text(await asyncio.to_thread(self.llm.invoke, prompt))
+    
+    async def _astream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Stream LLM output without blocking the event loop.
+        The synchronous llm.stream generator is drained in a worker thread and its
+        chunks are handed back to the loop through a queue as they arrive.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        
+        def _produce():
+            try:
+                for chunk in self.llm.stream(prompt):
+                    text = _text(chunk)
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+                
+        # Awaited only once the stream is exhausted; if the consumer stops early the
+        # thread runs to completion on its own
+        producer = asyncio.ensure_future(asyncio.to_thread(_produce))
+        
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            
+        await producer
+    
+    def _llm_string(self) -> str:
+        """Identify the model and every generation parameter for cache keys."""
+        try:
+            params = self.llm.config.model_dump(exclude={"api_key", "credentials_file"})
+        except Exception:
+            params = {"llm": type(self.llm).__name__}
+        params["temperature_override"] = self._temperature_override
+        return orjson.dumps(params, default=str, option=orjson.OPT_SORT_KEYS).decode()
+    
+    async def _cached_invoke(self, prompt: str) -> str:
+        """Invoke the LLM, short-circuiting through the response cache if configured."""
+        cache = self._response_cache
+        if cache is None:
+            return await self._ainvoke(prompt)
+        
+        key = prompt_cache_key(prompt)
+        llm_string = self._llm_string()
+        cached = await cache.alookup(key, llm_string)
+        if cached is not None:
+            self._log("LLM response cache hit")
+            return cached
+        
+        text = await self._ainvoke(prompt)
+        await cache.aupdate(key, llm_string, text)
+        return text
+    
     async def _create_plan(self, query: str) -> List[Dict[str, Any]]:
         """Create a TODO list plan for the query."""
         if not self.todo_list:
             return []
             
         # Generate planning prompt
-        planning_prompt = PLANNING_PROMPT.format(query=query)
+        planning_prompt = prompts.PLANNING_PROMPT.format(query=query)
         
         # Get plan from LLM
-        response = self.llm.invoke(planning_prompt)
-        plan_text = response.content if hasattr(response, 'content') else str(response)
+        plan_text = await self._cached_invoke(planning_prompt)
         
-        # Parse plan and create TODO items
+        # Parse plan and create TODO items in a single pass over the response
         tasks = []
-        lines = plan_text.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line and (line.startswith('-') or line.startswith('*') or line[0].isdigit()):
-                # Extract task description
-                task_desc = line.lstrip('-*0123456789. ').strip()
+        for match in _TASK_LINE_RE.finditer(plan_text):
+            task_desc = match.group(1)
+            desc_lc = task_desc.lower()
+            
+            # Determine priority based on keywords
+            priority = TaskPriority.MEDIUM
+            if _PRIO_HIGH_RE.search(desc_lc):
+                priority = TaskPriority.HIGH
+            elif _PRIO_LOW_RE.search(desc_lc):
+                priority = TaskPriority.LOW
                 
-                if task_desc:
-                    # Determine priority based on keywords
-                    priority = TaskPriority.MEDIUM
-                    if any(word in task_desc.lower() for word in ['critical', 'urgent', 'important']):
-                        priority = TaskPriority.HIGH
-                    elif any(word in task_desc.lower() for word in ['optional', 'nice to have']):
-                        priority = TaskPriority.LOW
-                        
-                    # Add task to TODO list
-                    task = self.todo_list.add_task(
-                        title=task_desc,
-                        priority=priority
-                    )
-                    tasks.append(task.model_dump())
+            # Add task to TODO list
+            task = self.todo_list.add_task(
+                title=task_desc,
+                priority=priority
+            )
+            # Only the fields consumers read; a full model_dump() is not needed
+            tasks.append({"id": task.id, "title": task.title, "priority": task.priority.value})
                     
         # Save plan to memory
         self._save_to_memory(
@@ -150,7 +302,8 @@ class DeepAgent:
             type=SubAgentType.RESEARCH,
             task_description=task_description,
             objectives=objectives,
-            context=context
+            context=context,
+            trusted=True
         )
         
         # Execute sub-agent
@@ -160,7 +313,7 @@ class DeepAgent:
             # Save sub-agent results to memory
             self._save_to_memory(
                 f"/subagents/{agent.id}/final_result.json",
-                json.dumps(result.model_dump(), indent=2, default=str)
+                _dumps(result)
             )
             
             return result.result
@@ -168,6 +321,32 @@ class DeepAgent:
             self._log(f"Sub-agent {agent.id} failed: {result.error if result else 'Unknown error'}", "error")
             return None
     
+    async def _spawn_with_timeout(
+        self,
+        task_description: str,
+        objectives: List[str],
+        context: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Spawn a sub-agent, giving up after timeout seconds (sub_agent_timeout_seconds
+        by default). A failing or timed-out sub-agent yields its exception in place
+        of a result.
+        """
+        if timeout is None:
+            timeout = self.config.sub_agent_timeout_seconds
+        try:
+            return await asyncio.wait_for(
+                self._spawn_sub_agent(task_description, objectives, context),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            self._log(f"Sub-agent for '{task_description}' timed out after {timeout}s", "warning")
+            return TimeoutError(f"Sub-agent timed out after {timeout}s")
+        except Exception as e:
+            self._log(f"Sub-agent for '{task_description}' failed: {e}", "error")
+            return e
+    
     async def _execute_task(self, task_id: str) -> bool:
         """Execute a single task from the TODO list."""
         if not self.todo_list:
@@ -180,52 +359,65 @@ class DeepAgent:
         self._log(f"Executing task: {task.title}")
         
         # Update task status
-        self.todo_list.update_task_status(task_id, TaskStatus.IN_PROGRESS)
+        async with self._todo_lock:
+            self.todo_list.update_task_status(task_id, TaskStatus.IN_PROGRESS)
         
         try:
             # Determine if this task needs a sub-agent
-            needs_sub_agent = any(word in task.title.lower() for word in [
-                'research', 'analyze', 'investigate', 'explore', 'deep dive'
-            ])
+            title_lc = task.title.lower()
+            needs_sub_agent = _SUBAGENT_RE.search(title_lc) is not None
             
             if needs_sub_agent and self.config.enable_sub_agents:
                 # Spawn sub-agent for this task
-                result = await self._spawn_sub_agent(
+                result = await self._spawn_with_timeout(
                     task_description=task.title,
                     objectives=[task.description] if task.description else [task.title],
                     context={"parent_query": self.state.query if self.state else ""}
                 )
+                if isinstance(result, Exception):
+                    raise result
                 
                 if result:
-                    self.todo_list.add_note_to_task(task_id, f"Sub-agent result: {result}")
+                    async with self._todo_lock:
+                        self.todo_list.add_note_to_task(task_id, f"Sub-agent result: {result}")
                     
             else:
                 # Execute task directly using tools
                 # This is a simplified implementation - in practice, would use the actual tools
-                self.todo_list.add_note_to_task(task_id, f"Executed at iteration {self.current_iteration}")
+                async with self._todo_lock:
+                    self.todo_list.add_note_to_task(task_id, f"Executed at iteration {self.current_iteration}")
                 
             # Mark task as completed
-            self.todo_list.update_task_status(task_id, TaskStatus.COMPLETED)
+            async with self._todo_lock:
+                self.todo_list.update_task_status(task_id, TaskStatus.COMPLETED)
             return True
             
         except Exception as e:
             self._log(f"Task execution failed: {e}", "error")
-            self.todo_list.update_task_status(task_id, TaskStatus.BLOCKED)
-            self.todo_list.add_note_to_task(task_id, f"Error: {str(e)}")
+            async with self._todo_lock:
+                self.todo_list.update_task_status(task_id, TaskStatus.BLOCKED)
+                self.todo_list.add_note_to_task(task_id, f"Error: {str(e)}")
             return False
     
-    async def _synthesize_results(self) -> str:
-        """Synthesize all results into a comprehensive answer."""
+    async def _execute_task_guarded(self, task_id: str) -> bool:
+        """Execute a task while holding a slot of the concurrency semaphore."""
+        async with self._sem:
+            return await self._execute_task(task_id)
+    
+    async def _synthesize_results(self) -> AsyncIterator[str]:
+        """Synthesize all results into a comprehensive answer, streamed as it is generated."""
         synthesis_parts = []
         
-        # Gather TODO list summary
+        # Gather TODO list summary. Completed tasks were moved to the completed log.
         if self.todo_list:
-            summary = self.todo_list.get_task_summary()
-            synthesis_parts.append(f"Completed {summary['completion_rate']:.1f}% of planned tasks")
+            completed = len(self._completed_log)
+            total = completed + len(self.todo_list.items)
+            completion_rate = completed / total * 100 if total else 0
+            synthesis_parts.append(f"Completed {completion_rate:.1f}% of planned tasks")
             
         # Gather sub-agent results
         if self.sub_agent_manager:
-            sub_summary = self.sub_agent_manager.get_summary()
+            sub_summary = self.sub_agent_manager.get_summary_cached()
             synthesis_parts.append(f"Executed {sub_summary['total_agents']} sub-agents")
             
         # Read key findings from memory
@@ -246,26 +438,49 @@ class DeepAgent:
         Provide a thorough, well-structured response that addresses all aspects of the query.
         """
         
-        response = self.llm.invoke(synthesis_prompt)
-        return response.content if hasattr(response, 'content') else str(response)
+        cache = self._response_cache
+        key = prompt_cache_key(synthesis_prompt) if cache else ""
+        llm_string = self._llm_string() if cache else ""
+        if cache:
+            cached = await cache.alookup(key, llm_string)
+            if cached is not None:
+                self._log("LLM response cache hit")
+                yield cached
+                return
+                
+        pieces = []
+        async for piece in self._astream(synthesis_prompt):
+            pieces.append(piece)
+            yield piece
+            
+        if cache:
+            await cache.aupdate(key, llm_string, "".join(pieces))
     
     async def process(
         self,
         query: str,
         context: Optional[Dict[str, Any]] = None
-    ) -> Iterator[Dict[str, Any]]:
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
         Process a query using the Deep Agent architecture.
         Yields status updates and intermediate results.
         """
         self.state = DeepAgentState(query=query)
         self.current_iteration = 0
+        self._t0 = time.monotonic()
+        self._progress_buf = []
+        self._completed_log = []
+        self._temperature_override = context.get("temperature_override") if context else None
+        # asyncio primitives bind to the loop they are first used on, and an agent
+        # may be run again on a different loop
+        self._sem = asyncio.Semaphore(self.config.max_sub_agents)
+        self._todo_lock = asyncio.Lock()
         
         # Initialize context in memory
         if self.filesystem and context:
             self._save_to_memory(
                 "/context/initial_context.json",
-                json.dumps(context, indent=2, default=str)
+                _dumps(context)
             )
             
         try:
@@ -282,44 +497,62 @@ class DeepAgent:
             for iteration in range(max_iterations):
                 self.current_iteration = iteration + 1
                 
+                evicted: List[TodoItem] = []
+                
                 # Get ready tasks
                 if self.todo_list:
-                    ready_tasks = self.todo_list.get_ready_tasks()
+                    batch = self.todo_list.get_ready_tasks(limit=self.config.max_sub_agents)
                     
-                    if not ready_tasks:
+                    if not batch:
                         # No more tasks ready
                         break
                         
-                    # Execute the highest priority ready task
-                    task = ready_tasks[0]
-                    yield {"type": "status", "message": f"Executing: {task.title}"}
+                    # Ready tasks have no pending dependencies, so execute the
+                    # highest priority batch of them concurrently
+                    for task in batch:
+                        yield {"type": "status", "message": f"Executing: {task.title}"}
                     
-                    success = await self._execute_task(task.id)
+                    results = await asyncio.gather(
+                        *(self._execute_task_guarded(task.id) for task in batch),
+                        return_exceptions=True
+                    )
                     
-                    yield {
-                        "type": "task_complete",
-                        "task": task.title,
-                        "success": success
-                    }
+                    for task, result in zip(batch, results):
+                        if isinstance(result, BaseException):
+                            self._log(f"Task {task.id} raised: {result}", "error")
+                        yield {
+                            "type": "task_complete",
+                            "task": task.title,
+                            "success": result is True
+                        }
+                        
+                    # Evict completed tasks so per-iteration scans only see active ones
+                    evicted = self.todo_list.pop_completed()
+                    self._completed_log.extend(evicted)
                     
                 # Update state
                 self.state.iterations_completed = self.current_iteration
                 
-                # Save progress to memory
+                # Record progress; written to memory in one go when the run ends
                 if self.filesystem:
-                    self._save_to_memory(
-                        f"/research/progress_iteration_{self.current_iteration}.json",
-                        json.dumps({
-                            "iteration": self.current_iteration,
-                            "todo_summary": self.todo_list.get_task_summary() if self.todo_list else None,
-                            "memory_summary": self.filesystem.get_summary(),
-                            "sub_agents_summary": self.sub_agent_manager.get_summary() if self.sub_agent_manager else None
-                        }, indent=2, default=str)
-                    )
+                    self._progress_buf.append({
+                        "iteration": self.current_iteration,
+                        "todo_summary": self.todo_list.get_task_summary_cached() if self.todo_list else None,
+                        # Only this iteration's; earlier ones are in earlier entries
+                        "completed_tasks": [task.title for task in evicted],
+                        "memory_summary": self.filesystem.get_summary_cached(),
+                        "sub_agents_summary": self.sub_agent_manager.get_summary_cached() if self.sub_agent_manager else None
+                    })
                     
+            self._flush_progress()
+            
             # Phase 3: Synthesis
             yield {"type": "status", "message": "Synthesizing results..."}
-            final_answer = await self._synthesize_results()
+            answer_pieces = []
+            async for piece in self._synthesize_results():
+                answer_pieces.append(piece)
+                yield {"type": "answer_chunk", "content": piece}
+            final_answer = "".join(answer_pieces)
             
             # Save final results
             if self.filesystem:
@@ -328,8 +561,9 @@ class DeepAgent:
                     final_answer
                 )
                 
-                # Export entire memory for debugging/analysis
-                memory_export = self.filesystem.export_to_json()
+                # Export entire memory for debugging/analysis. Serializing the whole
+                # tree is CPU-bound, so keep it off the event loop.
+                memory_export = await asyncio.to_thread(self.filesystem.export_to_json)
                 self._save_to_memory(
                     "/results/memory_export.json",
                     memory_export
@@ -340,8 +574,8 @@ class DeepAgent:
                 "content": final_answer,
                 "metadata": {
                     "iterations": self.state.iterations_completed,
-                    "tasks_completed": len([t for t in self.todo_list.items.values() if t.status == TaskStatus.COMPLETED]) if self.todo_list else 0,
-                    "execution_time": (datetime.now() - self.state.start_time).total_seconds()
+                    "tasks_completed": len(self._completed_log),
+                    "execution_time": time.monotonic() - self._t0
                 }
             }
             
@@ -353,6 +587,9 @@ class DeepAgent:
             }
             
         finally:
+            # Persist progress of runs that failed mid-execution
+            self._flush_progress()
+            
             # Cleanup
             if self.sub_agent_manager:
                 self.sub_agent_manager.cleanup_completed()
@@ -368,16 +605,18 @@ class DeepAgent:
         return {
             "query": self.state.query,
             "iterations_completed": self.state.iterations_completed,
-            "execution_time": (datetime.now() - self.state.start_time).total_seconds(),
-            "todo_summary": self.todo_list.get_task_summary() if self.todo_list else None,
-            "memory_summary": self.filesystem.get_summary() if self.filesystem else None,
-            "sub_agents_summary": self.sub_agent_manager.get_summary() if self.sub_agent_manager else None
+            "execution_time": time.monotonic() - self._t0,
+            "todo_summary": self.todo_list.get_task_summary_cached() if self.todo_list else None,
+            "memory_summary": self.filesystem.get_summary_cached() if self.filesystem else None,
+            "sub_agents_summary": self.sub_agent_manager.get_summary_cached() if self.sub_agent_manager else None
         }
     
     def reset(self):
         """Reset the Deep Agent to initial state."""
         self.state = None
         self.current_iteration = 0
+        self._progress_buf = []
+        self._completed_log = []
         
         if self.todo_list:
             self.todo_list = TodoList()
@@ -386,6 +625,6 @@ class DeepAgent:
             self.filesystem = VirtualFileSystem()
             
         if self.sub_agent_manager:
-            self.sub_agent_manager = SubAgentManager(self.filesystem)
+            self.sub_agent_manager = self._create_sub_agent_manager()
             
         self._log("Deep Agent reset to initial state")
@@ -2,19 +2,15 @@
 Integration layer for Deep Agent with existing chat/search flow.
 """
 
-import asyncio
-from typing import Iterator, Dict, Any, Optional, List
+import re
+from typing import Dict, Any, Optional, List, TYPE_CHECKING
 from collections.abc import AsyncIterator
 
-from onyx.agents.deep_agent.core import DeepAgent, DeepAgentConfig
 from onyx.chat.models import (
     AnswerStream,
     OnyxAnswerPiece, 
     StreamStopInfo,
-    StreamStopReason,
-    QADocsResponse,
-    CitationInfo,
-    MessageSpecificCitations
+    StreamStopReason
 )
 from onyx.llm.interfaces import LLM
 from onyx.tools.tool import Tool
@@ -22,8 +18,30 @@ from onyx.server.query_and_chat.models import CreateChatMessageRequest
 from onyx.server.query_and_chat.streaming_models import Packet
 from onyx.utils.logger import setup_logger
 
+if TYPE_CHECKING:
+    from onyx.agents.deep_agent.core import DeepAgent
+
 logger = setup_logger()
 
+# Keywords that suggest complex, multi-step tasks
+_DEEP_KEYWORDS = (
+    "deep dive", "comprehensive", "detailed analysis", "research",
+    "investigate", "explore thoroughly", "multiple aspects",
+    "step by step", "complete guide", "everything about",
+    "compare and contrast", "pros and cons", "full breakdown"
+)
+
+# All keywords are matched in one left-to-right scan of the lowercased query. The
+# pattern is a case-sensitive literal alternation, which lets the regex engine skip
+# ahead to positions whose character can start a keyword (IGNORECASE disables that
+# prefilter and makes the scan ~10x slower).
+_DEEP_KW_RE = re.compile(
+    "|".join(re.escape(kw) for kw in sorted(_DEEP_KEYWORDS, key=len, reverse=True))
+)
+
+# Queries with more words than this are routed to Deep Agent
+_LONG_QUERY_WORDS = 50
+
 
 class DeepAgentIntegration:
     """
@@ -33,10 +51,13 @@ class DeepAgentIntegration:
     def __init__(self, llm: LLM, tools: List[Tool]):
         self.llm = llm
         self.tools = tools
-        self.deep_agent: Optional[DeepAgent] = None
+        self.deep_agent: Optional["DeepAgent"] = None
         
-    def _initialize_deep_agent(self, verbose: bool = False) -> DeepAgent:
+    def _initialize_deep_agent(self, verbose: bool = False) -> "DeepAgent":
         """Initialize a Deep Agent instance."""
+        # Imported here so the agent stack is only loaded when actually used
+        from onyx.agents.deep_agent.core import DeepAgent, DeepAgentConfig
+        
         config = DeepAgentConfig(
             enable_planning=True,
             enable_sub_agents=True,
@@ -55,11 +76,17 @@ class DeepAgentIntegration:
     async def process_with_deep_agent(
         self,
         chat_request: CreateChatMessageRequest,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        force: bool = False
     ) -> AsyncIterator[AnswerStream]:
         """
         Process a chat request using Deep Agent and yield compatible stream objects.
+        Yields nothing if the request does not call for Deep Agent, unless forced.
         """
+        # Decide before building anything so that cold-path requests pay nothing
+        if not force and not self.should_use_deep_agent(chat_request):
+            return
+            
         # Initialize Deep Agent
         self.deep_agent = self._initialize_deep_agent(verbose=False)
         
@@ -124,10 +151,11 @@ class DeepAgentIntegration:
             elif update_type == "plan":
                 # Send plan as a structured update
                 tasks = update.get("data", [])
-                plan_text = "\n📋 **Task Plan:**\n"
-                for i, task in enumerate(tasks, 1):
-                    plan_text += f"{i}. {task.get('title', 'Unknown task')}\n"
-                    
+                plan_text = "\n📋 **Task Plan:**\n" + "".join(
+                    f"{i}. {task.get('title', 'Unknown task')}\n"
+                    for i, task in enumerate(tasks, 1)
+                )
+                
                 yield Packet(
                     answer_piece=OnyxAnswerPiece(
                         answer_piece=plan_text
@@ -146,30 +174,28 @@ class DeepAgentIntegration:
                     )
                 )
                 
+            elif update_type == "answer_chunk":
+                # Forward synthesized answer text as it is generated
+                piece = update.get("content", "")
+                answer_pieces.append(piece)
+                
+                yield Packet(
+                    answer_piece=OnyxAnswerPiece(
+                        answer_piece=piece
+                    )
+                )
+                
             elif update_type == "answer":
-                # Send the final synthesized answer
-                content = update.get("content", "")
+                # The answer text was already streamed as answer_chunk updates
                 metadata = update.get("metadata", {})
                 
-                # Split answer into pieces for streaming
-                # (In practice, might want to stream character by character)
-                sentences = content.split('. ')
-                for sentence in sentences:
-                    if sentence.strip():
-                        answer_piece = sentence + ('. ' if not sentence.endswith('.') else ' ')
-                        answer_pieces.append(answer_piece)
-                        
-                        yield Packet(
-                            answer_piece=OnyxAnswerPiece(
-                                answer_piece=answer_piece
-                            )
-                        )
-                        
                 # Add metadata summary
-                summary = f"\n\n---\n📊 **Deep Agent Summary:**\n"
-                summary += f"• Iterations: {metadata.get('iterations', 0)}\n"
-                summary += f"• Tasks completed: {metadata.get('tasks_completed', 0)}\n"
-                summary += f"• Execution time: {metadata.get('execution_time', 0):.2f}s\n"
+                summary = "\n".join([
+                    "\n\n---\n📊 **Deep Agent Summary:**",
+                    f"• Iterations: {metadata.get('iterations', 0)}",
+                    f"• Tasks completed: {metadata.get('tasks_completed', 0)}",
+                    f"• Execution time: {metadata.get('execution_time', 0):.2f}s\n",
+                ])
                 
                 yield Packet(
                     answer_piece=OnyxAnswerPiece(
@@ -211,24 +237,17 @@ class DeepAgentIntegration:
             return True
             
         # Auto-detection based on query characteristics
-        query = chat_request.message.lower()
-        
-        # Keywords that suggest complex, multi-step tasks
-        deep_keywords = [
-            "deep dive", "comprehensive", "detailed analysis", "research",
-            "investigate", "explore thoroughly", "multiple aspects",
-            "step by step", "complete guide", "everything about",
-            "compare and contrast", "pros and cons", "full breakdown"
-        ]
+        query = chat_request.message
         
         # Check for deep keywords
-        for keyword in deep_keywords:
-            if keyword in query:
-                logger.info(f"Auto-enabling Deep Agent due to keyword: {keyword}")
-                return True
+        match = _DEEP_KW_RE.search(query.lower())
+        if match:
+            logger.info(f"Auto-enabling Deep Agent due to keyword: {match.group(0)}")
+            return True
                 
-        # Check query length (longer queries might benefit from deep agent)
-        if len(query.split()) > 50:
+        # Check query length (longer queries might benefit from deep agent).
+        # maxsplit bounds the scan and the list to the first _LONG_QUERY_WORDS + 1 words.
+        if len(query.split(None, _LONG_QUERY_WORDS)) > _LONG_QUERY_WORDS:
             logger.info("Auto-enabling Deep Agent due to query length")
             return True
             
@@ -271,7 +290,7 @@ async def stream_with_deep_agent(
     # Check if Deep Agent should be used
     if force_deep_agent or integration.should_use_deep_agent(chat_request):
         logger.info("Using Deep Agent for query processing")
-        async for packet in integration.process_with_deep_agent(chat_request, context):
+        async for packet in integration.process_with_deep_agent(chat_request, context, force=True):
             yield packet
     else:
         # Return None to indicate standard flow should be used
@@ -2,32 +2,96 @@
 Virtual file system for Deep Agent memory management.
 """
 
-import json
-from typing import Dict, Any, Optional, List
+import functools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Iterable, Iterator, KeysView, TextIO, Union
 from datetime import datetime
-from pathlib import Path
-from pydantic import BaseModel, Field
+import orjson
 
 from onyx.utils.logger import setup_logger
 
 logger = setup_logger()
 
 
-class VirtualFile(BaseModel):
+@functools.lru_cache(maxsize=4096)
+def _resolve(path: str, cwd_prefix: str) -> str:
+    """
+    Normalize a path against a working directory given with a trailing slash.
+    Pure, so safe to memoize.
+    """
+    if not path.startswith("/"):
+        # Relative path
+        path = cwd_prefix + path
+        
+    # Normalize path
+    parts = []
+    for part in path.split("/"):
+        if part == "..":
+            if parts:
+                parts.pop()
+        elif part and part != ".":
+            parts.append(part)
+            
+    return "/" + "/".join(parts) if parts else "/"
+
+
+def _ns_to_iso(ns: int) -> str:
+    """Format an epoch-nanosecond timestamp as a local ISO 8601 string."""
+    seconds, remainder = divmod(ns, 1_000_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=remainder // 1000).isoformat()
+
+
+def _iso_to_ns(value: str) -> int:
+    """Parse a local ISO 8601 string into an epoch-nanosecond timestamp."""
+    dt = datetime.fromisoformat(value)
+    return int(dt.replace(microsecond=0).timestamp()) * 1_000_000_000 + dt.microsecond * 1000
+
+
+# Size of the filename trigram Bloom filter used to short-circuit missed searches
+_NAME_BLOOM_BITS = 1 << 14
+_NAME_BLOOM_MASK = _NAME_BLOOM_BITS - 1
+
+
+def _trigrams(text: str) -> set[str]:
+    """All length-3 substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+@dataclass(slots=True)
+class VirtualFile:
     """Represents a file in the virtual file system."""
-    path: str = Field(description="File path in virtual filesystem")
-    content: str = Field(description="File content")
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
-    metadata: Dict[str, Any] = Field(default_factory=dict)
+    path: str  # File path in virtual filesystem
+    # Content is kept as a list of chunks so appends do not copy the whole file;
+    # the chunks are joined (and collapsed into one) when the content is read
+    content_chunks: List[str]
+    created_at: int = field(default_factory=time.time_ns)  # ns since epoch
+    updated_at: int = field(default_factory=time.time_ns)  # ns since epoch
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    
+    @property
+    def content(self) -> str:
+        if len(self.content_chunks) != 1:
+            self.content_chunks = ["".join(self.content_chunks)]
+        return self.content_chunks[0]
+    
+    @content.setter
+    def content(self, value: str):
+        self.content_chunks = [value]
+        
+    @property
+    def size(self) -> int:
+        return sum(map(len, self.content_chunks))
     
     
-class VirtualDirectory(BaseModel):
+@dataclass(slots=True)
+class VirtualDirectory:
     """Represents a directory in the virtual file system."""
-    path: str = Field(description="Directory path")
-    files: Dict[str, VirtualFile] = Field(default_factory=dict)
-    subdirectories: Dict[str, "VirtualDirectory"] = Field(default_factory=dict)
-    created_at: datetime = Field(default_factory=datetime.now)
+    path: str
+    files: Dict[str, VirtualFile] = field(default_factory=dict)
+    subdirectories: Dict[str, "VirtualDirectory"] = field(default_factory=dict)
+    created_at: int = field(default_factory=time.time_ns)  # ns since epoch
     
 
 class VirtualFileSystem:
@@ -39,6 +103,22 @@ class VirtualFileSystem:
     def __init__(self):
         self.root = VirtualDirectory(path="/")
         self.current_directory = "/"
+        # current_directory with a trailing slash, for resolving relative paths
+        self._cwd_prefix = "/"
+        # Flat indexes keyed by absolute path, kept in sync with the tree so that
+        # lookups are a single dict hit instead of a walk from the root
+        self._path_index: Dict[str, VirtualDirectory] = {"/": self.root}
+        self._file_index: Dict[str, VirtualFile] = {}
+        # Running totals for get_summary, maintained by every mutation
+        self._total_files = 0
+        self._total_dirs = 0
+        self._total_bytes = 0
+        # Bloom filter over the lowercased trigrams of every filename ever added.
+        # Deletes leave their bits set, which only costs false positives
+        self._name_bloom = bytearray(_NAME_BLOOM_BITS // 8)
+        # Bumped on every mutation; get_summary_cached recomputes only when it changes
+        self._version = 0
+        self._summary_cache: Optional[tuple[int, Dict[str, Any]]] = None
         self._initialize_default_structure()
         
     def _initialize_default_structure(self):
@@ -52,28 +132,19 @@ class VirtualFileSystem:
             "/temp"
         ]
         
-        for dir_path in default_dirs:
-            self.create_directory(dir_path)
+        self.create_directories(default_dirs)
             
     def _resolve_path(self, path: str) -> str:
         """Resolve relative paths to absolute paths."""
-        if not path.startswith("/"):
-            # Relative path
-            if self.current_directory == "/":
-                path = "/" + path
-            else:
-                path = self.current_directory + "/" + path
-                
-        # Normalize path
-        parts = []
-        for part in path.split("/"):
-            if part == "..":
-                if parts:
-                    parts.pop()
-            elif part and part != ".":
-                parts.append(part)
-                
-        return "/" + "/".join(parts) if parts else "/"
+        # Already-normalized absolute paths are by far the common case
+        if (
+            path.startswith("/")
+            and "/." not in path
+            and "//" not in path
+            and (len(path) == 1 or not path.endswith("/"))
+        ):
+            return path
+        return _resolve(path, self._cwd_prefix)
     
     def _get_parent_and_name(self, path: str) -> tuple[VirtualDirectory, str]:
         """Get parent directory and file/dir name from path."""
@@ -82,11 +153,11 @@ class VirtualFileSystem:
         if path == "/":
             raise ValueError("Cannot get parent of root directory")
             
-        parts = path.strip("/").split("/")
-        name = parts[-1]
-        parent_path = "/" + "/".join(parts[:-1]) if len(parts) > 1 else "/"
+        idx = path.rfind("/")
+        parent_path = path[:idx] or "/"
+        name = path[idx + 1:]
         
-        parent = self._get_directory(parent_path)
+        parent = self._path_index.get(parent_path)
         if not parent:
             raise ValueError(f"Parent directory {parent_path} does not exist")
             
@@ -94,40 +165,60 @@ class VirtualFileSystem:
     
     def _get_directory(self, path: str) -> Optional[VirtualDirectory]:
         """Get directory object by path."""
-        path = self._resolve_path(path)
-        
+        return self._path_index.get(self._resolve_path(path))
+    
+    def _add_directory(self, path: str) -> bool:
+        """Create a directory at an already-resolved path."""
+        if path in self._path_index:
+            logger.debug(f"Directory {path} already exists")
+            return False
+            
         if path == "/":
-            return self.root
+            raise ValueError("Cannot get parent of root directory")
+        idx = path.rfind("/")
+        parent_path = path[:idx] or "/"
+        parent = self._path_index.get(parent_path)
+        if not parent:
+            raise ValueError(f"Parent directory {parent_path} does not exist")
             
-        parts = path.strip("/").split("/")
-        current = self.root
-        
-        for part in parts:
-            if part in current.subdirectories:
-                current = current.subdirectories[part]
-            else:
-                return None
-                
-        return current
+        new_dir = VirtualDirectory(path=path)
+        parent.subdirectories[path[idx + 1:]] = new_dir
+        self._path_index[path] = new_dir
+        self._total_dirs += 1
+        logger.debug(f"Created directory: {path}")
+        return True
     
     def create_directory(self, path: str) -> bool:
         """Create a new directory."""
         try:
             path = self._resolve_path(path)
-            
-            if self._get_directory(path):
-                logger.debug(f"Directory {path} already exists")
+            if not self._add_directory(path):
                 return False
-                
-            parent, name = self._get_parent_and_name(path)
-            parent.subdirectories[name] = VirtualDirectory(path=path)
-            logger.debug(f"Created directory: {path}")
+            self._version += 1
             return True
             
         except Exception as e:
             logger.error(f"Failed to create directory {path}: {e}")
             return False
     
+    def create_directories(self, paths: Iterable[str]) -> bool:
+        """Create several directories in order. Returns True only if every one was created."""
+        ok = True
+        created = False
+        for path in paths:
+            try:
+                path = self._resolve_path(path)
+                if self._add_directory(path):
+                    created = True
+                else:
+                    ok = False
+            except Exception as e:
+                logger.error(f"Failed to create directory {path}: {e}")
+                ok = False
+        if created:
+            self._version += 1
+        return ok
+            
     def write_file(
         self,
         path: str,
@@ -137,23 +228,31 @@ class VirtualFileSystem:
         """Write or update a file."""
         try:
             path = self._resolve_path(path)
-            parent, name = self._get_parent_and_name(path)
+            file = self._file_index.get(path)
             
-            if name in parent.files:
+            if file is not None:
                 # Update existing file
-                file = parent.files[name]
+                self._version += 1
+                self._total_bytes += len(content) - file.size
                 file.content = content
-                file.updated_at = datetime.now()
+                file.updated_at = time.time_ns()
                 if metadata:
                     file.metadata.update(metadata)
                 logger.debug(f"Updated file: {path}")
             else:
                 # Create new file
-                parent.files[name] = VirtualFile(
+                parent, name = self._get_parent_and_name(path)
+                self._version += 1
+                new_file = VirtualFile(
                     path=path,
-                    content=content,
+                    content_chunks=[content],
                     metadata=metadata or {}
                 )
+                parent.files[name] = new_file
+                self._file_index[path] = new_file
+                self._add_to_name_bloom(self._name_bloom, name)
+                self._total_files += 1
+                self._total_bytes += len(content)
                 logger.debug(f"Created file: {path}")
                 
             return True
@@ -162,58 +261,108 @@ class VirtualFileSystem:
             logger.error(f"Failed to write file {path}: {e}")
             return False
     
+    def write_files(self, files: Dict[str, str]) -> bool:
+        """
+        Write or update several files. Returns True only if every write succeeded.
+        The files share one timestamp, and the version and byte total are updated
+        once for the whole batch.
+        """
+        ok = True
+        now = time.time_ns()
+        bytes_delta = 0
+        written = 0
+        
+        for path, content in files.items():
+            try:
+                path = self._resolve_path(path)
+                file = self._file_index.get(path)
+                
+                if file is not None:
+                    bytes_delta += len(content) - file.size
+                    file.content_chunks = [content]
+                    file.updated_at = now
+                else:
+                    parent, name = self._get_parent_and_name(path)
+                    new_file = VirtualFile(
+                        path=path,
+                        content_chunks=[content],
+                        created_at=now,
+                        updated_at=now
+                    )
+                    parent.files[name] = new_file
+                    self._file_index[path] = new_file
+                    self._add_to_name_bloom(self._name_bloom, name)
+                    self._total_files += 1
+                    bytes_delta += len(content)
+                written += 1
+                
+            except Exception as e:
+                logger.error(f"Failed to write file {path}: {e}")
+                ok = False
+                
+        if written:
+            self._total_bytes += bytes_delta
+            self._version += 1
+            logger.debug(f"Wrote {written} files")
+        return ok
+    
     def read_file(self, path: str) -> Optional[str]:
         """Read file content."""
-        try:
-            path = self._resolve_path(path)
-            parent, name = self._get_parent_and_name(path)
-            
-            if name in parent.files:
-                return parent.files[name].content
-            else:
-                logger.warning(f"File not found: {path}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Failed to read file {path}: {e}")
+        path = self._resolve_path(path)
+        file = self._file_index.get(path)
+        
+        if file is None:
+            logger.warning(f"File not found: {path}")
             return None
+            
+        return file.content
     
     def append_to_file(self, path: str, content: str) -> bool:
         """Append content to an existing file."""
-        existing = self.read_file(path)
-        if existing is None:
+        path = self._resolve_path(path)
+        file = self._file_index.get(path)
+        if file is None:
             return self.write_file(path, content)
-        else:
-            return self.write_file(path, existing + "\n" + content)
+            
+        file.content_chunks.append("\n" + content)
+        file.updated_at = time.time_ns()
+        self._total_bytes += 1 + len(content)
+        self._version += 1
+        logger.debug(f"Appended to file: {path}")
+        return True
     
     def delete_file(self, path: str) -> bool:
         """Delete a file."""
-        try:
-            path = self._resolve_path(path)
-            parent, name = self._get_parent_and_name(path)
-            
-            if name in parent.files:
-                del parent.files[name]
-                logger.debug(f"Deleted file: {path}")
-                return True
-            else:
-                logger.warning(f"File not found: {path}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Failed to delete file {path}: {e}")
+        path = self._resolve_path(path)
+        file = self._file_index.pop(path, None)
+        
+        if file is None:
+            logger.warning(f"File not found: {path}")
             return False
+            
+        # Every indexed file's parent is indexed too
+        idx = path.rfind("/")
+        del self._path_index[path[:idx] or "/"].files[path[idx + 1:]]
+        self._total_files -= 1
+        self._total_bytes -= file.size
+        self._version += 1
+        logger.debug(f"Deleted file: {path}")
+        return True
     
-    def list_directory(self, path: str = "/") -> Optional[Dict[str, List[str]]]:
-        """List contents of a directory."""
+    def list_directory(self, path: str = "/") -> Optional[Dict[str, KeysView[str]]]:
+        """
+        List contents of a directory.
+        The names are live views of the directory, not copies; callers that
+        modify the directory while iterating should copy them with list().
+        """
         directory = self._get_directory(path)
         if not directory:
             logger.warning(f"Directory not found: {path}")
             return None
             
         return {
-            "files": list(directory.files.keys()),
-            "directories": list(directory.subdirectories.keys())
+            "files": directory.files.keys(),
+            "directories": directory.subdirectories.keys()
         }
     
     def change_directory(self, path: str) -> bool:
@@ -221,6 +370,8 @@ class VirtualFileSystem:
         path = self._resolve_path(path)
         if self._get_directory(path):
             self.current_directory = path
+            self._cwd_prefix = path if path == "/" else path + "/"
+            self._version += 1
             logger.debug(f"Changed directory to: {path}")
             return True
         else:
@@ -229,112 +380,170 @@ class VirtualFileSystem:
     
     def get_file_metadata(self, path: str) -> Optional[Dict[str, Any]]:
         """Get metadata for a file."""
-        try:
-            path = self._resolve_path(path)
-            parent, name = self._get_parent_and_name(path)
+        file = self._file_index.get(self._resolve_path(path))
+        if file is None:
+            return None
             
-            if name in parent.files:
-                file = parent.files[name]
-                return {
-                    "created_at": file.created_at.isoformat(),
-                    "updated_at": file.updated_at.isoformat(),
-                    "size": len(file.content),
-                    "metadata": file.metadata
-                }
-            else:
-                return None
+        return {
+            "created_at": _ns_to_iso(file.created_at),
+            "updated_at": _ns_to_iso(file.updated_at),
+            "size": file.size,
+            "metadata": file.metadata
+        }
+    
+    @staticmethod
+    def _add_to_name_bloom(bloom: bytearray, name: str):
+        """Set the Bloom filter bits for each trigram of a filename."""
+        for gram in _trigrams(name.lower()):
+            h = hash(gram)
+            for bit in (h & _NAME_BLOOM_MASK, (h >> 16) & _NAME_BLOOM_MASK):
+                bloom[bit >> 3] |= 1 << (bit & 7)
                 
-        except Exception as e:
-            logger.error(f"Failed to get metadata for {path}: {e}")
-            return None
+    def _name_bloom_may_match(self, pattern: str) -> bool:
+        """False only if no filename can contain the (lowercased) pattern."""
+        bloom = self._name_bloom
+        for gram in _trigrams(pattern):
+            h = hash(gram)
+            for bit in (h & _NAME_BLOOM_MASK, (h >> 16) & _NAME_BLOOM_MASK):
+                if not bloom[bit >> 3] & (1 << (bit & 7)):
+                    return False
+        return True
     
     def search_files(self, pattern: str, directory: str = "/") -> List[str]:
         """Search for files matching a pattern."""
         matches = []
         
-        def _search_recursive(dir_obj: VirtualDirectory, pattern: str):
-            for filename in dir_obj.files:
-                if pattern.lower() in filename.lower():
-                    file_path = dir_obj.path + "/" + filename if dir_obj.path != "/" else "/" + filename
-                    matches.append(file_path)
-                    
-            for subdir in dir_obj.subdirectories.values():
-                _search_recursive(subdir, pattern)
-        
         start_dir = self._get_directory(directory)
-        if start_dir:
-            _search_recursive(start_dir, pattern)
+        if not start_dir:
+            return matches
+            
+        pattern = pattern.lower()
+        if not self._name_bloom_may_match(pattern):
+            return matches
+            
+        # Depth-first walk, children pushed in reverse to keep pre-order results
+        stack = deque([start_dir])
+        while stack:
+            dir_obj = stack.pop()
+            for filename, file in dir_obj.files.items():
+                if pattern in filename.lower():
+                    matches.append(file.path)
+                    
+            stack.extend(reversed(dir_obj.subdirectories.values()))
             
         return matches
     
+    def iter_json(self) -> Iterator[str]:
+        """
+        Yield the JSON export of the file system as text fragments, one file at a
+        time, so the whole tree never has to be materialized as a dict.
+        """
+        # Pending work: directories still to serialize, or literal text to emit
+        stack: List[Union[VirtualDirectory, str]] = [self.root]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                yield item
+                continue
+                
+            yield '{"path":' + orjson.dumps(item.path).decode() + ',"files":{'
+            separator = ""
+            for name, file in item.files.items():
+                yield separator + orjson.dumps(name).decode() + ":" + orjson.dumps({
+                    "content": file.content,
+                    "created_at": _ns_to_iso(file.created_at),
+                    "updated_at": _ns_to_iso(file.updated_at),
+                    "metadata": file.metadata
+                }, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+                separator = ","
+            yield '},"subdirectories":{'
+            
+            # Pushed in reverse so subdirectories are emitted in their original order
+            stack.append("}}")
+            subdirs = list(item.subdirectories.items())
+            for i in range(len(subdirs) - 1, -1, -1):
+                name, subdir = subdirs[i]
+                stack.append(subdir)
+                stack.append(("," if i else "") + orjson.dumps(name).decode() + ":")
+    
     def export_to_json(self) -> str:
         """Export entire file system to JSON."""
-        def _dir_to_dict(directory: VirtualDirectory) -> Dict[str, Any]:
-            return {
-                "path": directory.path,
-                "files": {
-                    name: {
-                        "content": file.content,
-                        "created_at": file.created_at.isoformat(),
-                        "updated_at": file.updated_at.isoformat(),
-                        "metadata": file.metadata
-                    }
-                    for name, file in directory.files.items()
-                },
-                "subdirectories": {
-                    name: _dir_to_dict(subdir)
-                    for name, subdir in directory.subdirectories.items()
-                }
-            }
+        return "".join(self.iter_json())
+    
+    def export_to_file(self, fp: TextIO):
+        """Export entire file system as JSON to a writable text stream."""
+        for fragment in self.iter_json():
+            fp.write(fragment)
+    
+    @staticmethod
+    def _dict_to_dir(data: Dict[str, Any]) -> VirtualDirectory:
+        """Deserialize a directory's own fields and files; subdirectories are filled in by the caller."""
+        path = data["path"]
+        directory = VirtualDirectory(path=path)
+        prefix = path if path == "/" else path + "/"
         
-        return json.dumps(_dir_to_dict(self.root), indent=2)
+        for name, file_data in data.get("files", {}).items():
+            created_at = file_data["created_at"]
+            updated_at = file_data["updated_at"]
+            created_ns = _iso_to_ns(created_at)
+            # Files that were never rewritten share one timestamp; parse it once
+            updated_ns = created_ns if updated_at == created_at else _iso_to_ns(updated_at)
+            directory.files[name] = VirtualFile(
+                path=prefix + name,
+                content_chunks=[file_data["content"]],
+                created_at=created_ns,
+                updated_at=updated_ns,
+                metadata=file_data.get("metadata", {})
+            )
+            
+        return directory
     
     def import_from_json(self, json_str: str):
         """Import file system from JSON."""
-        def _dict_to_dir(data: Dict[str, Any]) -> VirtualDirectory:
-            directory = VirtualDirectory(path=data["path"])
-            
-            for name, file_data in data.get("files", {}).items():
-                directory.files[name] = VirtualFile(
-                    path=data["path"] + "/" + name if data["path"] != "/" else "/" + name,
-                    content=file_data["content"],
-                    created_at=datetime.fromisoformat(file_data["created_at"]),
-                    updated_at=datetime.fromisoformat(file_data["updated_at"]),
-                    metadata=file_data.get("metadata", {})
-                )
-                
-            for name, subdir_data in data.get("subdirectories", {}).items():
-                directory.subdirectories[name] = _dict_to_dir(subdir_data)
-                
-            return directory
-        
         try:
-            data = json.loads(json_str)
-            self.root = _dict_to_dir(data)
+            data = orjson.loads(json_str)
+            root = self._dict_to_dir(data)
+            path_index = {"/": root}
+            file_index = {}
+            total_bytes = 0
+            name_bloom = bytearray(_NAME_BLOOM_BITS // 8)
+            
+            stack = deque([(data, root)])
+            while stack:
+                dir_data, directory = stack.pop()
+                for name, file in directory.files.items():
+                    file_index[file.path] = file
+                    total_bytes += file.size
+                    self._add_to_name_bloom(name_bloom, name)
+                for name, subdir_data in dir_data.get("subdirectories", {}).items():
+                    subdir = self._dict_to_dir(subdir_data)
+                    directory.subdirectories[name] = subdir
+                    path_index[subdir.path] = subdir
+                    stack.append((subdir_data, subdir))
+                    
+            self.root = root
+            self._path_index = path_index
+            self._file_index = file_index
+            self._total_files = len(file_index)
+            self._total_dirs = len(path_index) - 1
+            self._total_bytes = total_bytes
+            self._name_bloom = name_bloom
+            self._version += 1
             logger.info("Successfully imported file system from JSON")
         except Exception as e:
             logger.error(f"Failed to import file system: {e}")
     
     def get_summary(self) -> Dict[str, Any]:
         """Get a summary of the file system."""
-        def _count_recursive(directory: VirtualDirectory) -> tuple[int, int, int]:
-            file_count = len(directory.files)
-            dir_count = len(directory.subdirectories)
-            total_size = sum(len(f.content) for f in directory.files.values())
-            
-            for subdir in directory.subdirectories.values():
-                sub_files, sub_dirs, sub_size = _count_recursive(subdir)
-                file_count += sub_files
-                dir_count += sub_dirs
-                total_size += sub_size
-                
-            return file_count, dir_count, total_size
-        
-        files, dirs, size = _count_recursive(self.root)
-        
         return {
-            "total_files": files,
-            "total_directories": dirs,
-            "total_size_bytes": size,
+            "total_files": self._total_files,
+            "total_directories": self._total_dirs,
+            "total_size_bytes": self._total_bytes,
             "current_directory": self.current_directory
         }
+    
+    def get_summary_cached(self) -> Dict[str, Any]:
+        """Get the file system summary, recomputing it only after a mutation."""
+        if self._summary_cache is None or self._summary_cache[0] != self._version:
+            self._summary_cache = (self._version, self.get_summary())
+        return self._summary_cache[1]
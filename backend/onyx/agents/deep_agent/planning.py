@@ -2,10 +2,12 @@
 Planning tools for Deep Agent, including the TODO list tool.
 """
 
+import heapq
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
 from typing import List, Optional, Dict, Any
-from datetime import datetime
-from enum import Enum
-from pydantic import BaseModel, Field
+from enum import Enum, IntEnum
 
 from onyx.utils.logger import setup_logger
 
@@ -21,7 +23,7 @@ class TaskStatus(Enum):
     CANCELLED = "cancelled"
 
 
-class TaskPriority(Enum):
+class TaskPriority(IntEnum):
     """Priority levels for tasks."""
     LOW = 1
     MEDIUM = 2
@@ -29,20 +31,35 @@ class TaskPriority(Enum):
     CRITICAL = 4
 
 
-class TodoItem(BaseModel):
+# Markdown fragments for to_markdown, keyed by TaskStatus and indexed by TaskPriority
+_STATUS_HEADERS = {
+    status: f"\n## {status.value.replace('_', ' ').title()}\n" for status in TaskStatus
+}
+_PRIORITY_MARKERS = ("", "!", "!!", "!!!", "!!!!")
+_TASK_LINE_PREFIXES = {
+    status: tuple(
+        f"- [{'x' if status == TaskStatus.COMPLETED else ' '}] {marker} "
+        for marker in _PRIORITY_MARKERS
+    )
+    for status in TaskStatus
+}
+
+
+@dataclass(slots=True)
+class TodoItem:
     """Individual TODO item with metadata."""
-    id: str = Field(description="Unique identifier for the task")
-    title: str = Field(description="Short description of the task")
-    description: Optional[str] = Field(None, description="Detailed task description")
-    status: TaskStatus = Field(TaskStatus.PENDING, description="Current task status")
-    priority: TaskPriority = Field(TaskPriority.MEDIUM, description="Task priority")
-    dependencies: List[str] = Field(default_factory=list, description="IDs of tasks this depends on")
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
-    completed_at: Optional[datetime] = None
-    assigned_to: Optional[str] = Field(None, description="Sub-agent ID if assigned")
-    notes: List[str] = Field(default_factory=list, description="Additional notes")
-    metadata: Dict[str, Any] = Field(default_factory=dict, description="Additional metadata")
+    id: str
+    title: str  # Short description of the task
+    description: Optional[str] = None
+    status: TaskStatus = TaskStatus.PENDING
+    priority: TaskPriority = TaskPriority.MEDIUM
+    dependencies: List[str] = field(default_factory=list)  # IDs of tasks this depends on
+    created_at: int = field(default_factory=time.time_ns)  # ns since epoch
+    updated_at: int = field(default_factory=time.time_ns)  # ns since epoch
+    completed_at: Optional[int] = None  # ns since epoch
+    assigned_to: Optional[str] = None  # Sub-agent ID if assigned
+    notes: List[str] = field(default_factory=list)
+    metadata: Dict[str, Any] = field(default_factory=dict)
 
 
 class TodoList:
@@ -54,6 +71,25 @@ class TodoList:
     def __init__(self):
         self.items: Dict[str, TodoItem] = {}
         self.next_id = 1
+        # Bumped on every mutation; get_task_summary_cached recomputes only when it changes
+        self._version = 0
+        self._summary_cache: Optional[tuple[int, Dict[str, Any]]] = None
+        # Task counts per TaskStatus, maintained by every mutation
+        self._status_counts: Dict[TaskStatus, int] = {status: 0 for status in TaskStatus}
+        # Completed tasks removed by pop_completed since the last clear_completed;
+        # they still count towards the summary
+        self._evicted_completed = 0
+        # Dependency bookkeeping for get_ready_tasks: the number of each task's
+        # dependencies that exist and are not completed, and the reverse edges.
+        # Dependencies on unknown or removed tasks count as met.
+        self._remaining_deps: Dict[str, int] = {}
+        self._dependents: Dict[str, List[str]] = {}
+        # Min-heap of (-priority, creation order, task ID) for tasks that became
+        # ready; entries for tasks that have since stopped being ready are
+        # dropped lazily by get_ready_tasks
+        self._ready_heap: List[tuple[int, int, str]] = []
+        self._ready_queued: set[str] = set()
+        self._creation_order: Dict[str, int] = {}
         
     def add_task(
         self,
@@ -75,6 +111,20 @@ class TodoList:
         )
         
         self.items[task_id] = task
+        self._status_counts[task.status] += 1
+        
+        self._remaining_deps[task_id] = 0
+        for dep_id in task.dependencies:
+            self._dependents.setdefault(dep_id, []).append(task_id)
+            dep = self.items.get(dep_id)
+            if dep is not None and dep.status != TaskStatus.COMPLETED:
+                self._remaining_deps[task_id] += 1
+        # Tasks that named this ID before it existed now wait on it
+        self._adjust_dependents(task_id, 1)
+        self._creation_order[task_id] = self.next_id
+        self._queue_if_ready(task_id)
+        
+        self._version += 1
         logger.debug(f"Added task {task_id}: {title}")
         return task
     
@@ -85,11 +135,19 @@ class TodoList:
             return None
             
         task = self.items[task_id]
+        was_completed = task.status == TaskStatus.COMPLETED
+        self._status_counts[task.status] -= 1
+        self._status_counts[status] += 1
         task.status = status
-        task.updated_at = datetime.now()
+        
+        if was_completed != (status == TaskStatus.COMPLETED):
+            self._adjust_dependents(task_id, 1 if was_completed else -1)
+        self._queue_if_ready(task_id)
+        self._version += 1
+        task.updated_at = time.time_ns()
         
         if status == TaskStatus.COMPLETED:
-            task.completed_at = datetime.now()
+            task.completed_at = task.updated_at
             
         logger.debug(f"Updated task {task_id} status to {status.value}")
         return task
@@ -102,7 +160,7 @@ class TodoList:
             
         task = self.items[task_id]
         task.notes.append(note)
-        task.updated_at = datetime.now()
+        task.updated_at = time.time_ns()
         return task
     
     def assign_task(self, task_id: str, agent_id: str) -> Optional[TodoItem]:
@@ -113,78 +171,109 @@ class TodoList:
             
         task = self.items[task_id]
         task.assigned_to = agent_id
-        task.updated_at = datetime.now()
+        task.updated_at = time.time_ns()
         logger.debug(f"Assigned task {task_id} to agent {agent_id}")
         return task
     
-    def get_ready_tasks(self) -> List[TodoItem]:
-        """Get tasks that are ready to be executed (no pending dependencies)."""
-        ready_tasks = []
-        
-        for task in self.items.values():
-            if task.status != TaskStatus.PENDING:
-                continue
-                
-            # Check if all dependencies are completed
-            dependencies_met = all(
-                self.items.get(dep_id, TodoItem(id="", title="", status=TaskStatus.COMPLETED)).status == TaskStatus.COMPLETED
-                for dep_id in task.dependencies
+    def _adjust_dependents(self, task_id: str, delta: int):
+        """Shift the unmet-dependency count of every task that depends on task_id."""
+        for dependent_id in self._dependents.get(task_id, ()):
+            if dependent_id in self._remaining_deps:
+                self._remaining_deps[dependent_id] += delta
+                self._queue_if_ready(dependent_id)
+    
+    def _is_ready(self, task_id: str) -> bool:
+        """Whether a task is pending with all of its dependencies met."""
+        return (
+            self._remaining_deps.get(task_id) == 0
+            and self.items[task_id].status == TaskStatus.PENDING
+        )
+    
+    def _queue_if_ready(self, task_id: str):
+        """Push a task onto the ready heap if it is ready and not already queued."""
+        if task_id not in self._ready_queued and self._is_ready(task_id):
+            task = self.items[task_id]
+            heapq.heappush(
+                self._ready_heap,
+                (-task.priority, self._creation_order[task_id], task_id)
             )
-            
-            if dependencies_met:
-                ready_tasks.append(task)
+            self._ready_queued.add(task_id)
+    
+    def get_ready_tasks(self, limit: Optional[int] = None) -> List[TodoItem]:
+        """
+        Get tasks that are ready to be executed (no pending dependencies),
+        highest priority first. If limit is given, only the top tasks are returned.
+        """
+        heap = self._ready_heap
+        taken: List[tuple[int, int, str]] = []
+        while heap and (limit is None or len(taken) < limit):
+            entry = heapq.heappop(heap)
+            if self._is_ready(entry[2]):
+                taken.append(entry)
+            else:
+                # Stale entry for a task that stopped being ready
+                self._ready_queued.discard(entry[2])
                 
-        # Sort by priority (highest first)
-        ready_tasks.sort(key=lambda t: t.priority.value, reverse=True)
-        return ready_tasks
+        # Still ready until their status changes, so they go back on the heap.
+        # taken is sorted, so each push lands at the bottom in O(1).
+        for entry in taken:
+            heapq.heappush(heap, entry)
+        return [self.items[entry[2]] for entry in taken]
     
     def get_task_summary(self) -> Dict[str, Any]:
         """Get a summary of the TODO list status."""
-        status_counts = {status: 0 for status in TaskStatus}
-        for task in self.items.values():
-            status_counts[task.status] += 1
-            
+        status_counts = dict(self._status_counts)
+        status_counts[TaskStatus.COMPLETED] += self._evicted_completed
+        total_tasks = sum(status_counts.values())
+        
         return {
-            "total_tasks": len(self.items),
-            "status_breakdown": {s.value: c for s, c in status_counts.items()},
+            "total_tasks": total_tasks,
+            "status_breakdown": {s.value: n for s, n in status_counts.items()},
             "ready_tasks": len(self.get_ready_tasks()),
             "completion_rate": (
-                status_counts[TaskStatus.COMPLETED] / len(self.items) * 100
-                if self.items else 0
+                status_counts[TaskStatus.COMPLETED] / total_tasks * 100
+                if total_tasks else 0
             )
         }
     
+    def get_task_summary_cached(self) -> Dict[str, Any]:
+        """Get the TODO list summary, recomputing it only after a mutation."""
+        if self._summary_cache is None or self._summary_cache[0] != self._version:
+            self._summary_cache = (self._version, self.get_task_summary())
+        return self._summary_cache[1]
+    
     def to_markdown(self) -> str:
         """Export TODO list as markdown for display."""
         lines = ["# TODO List\n"]
         
-        # Group by status
+        # Group by status in a single pass
+        by_status: Dict[TaskStatus, List[TodoItem]] = defaultdict(list)
+        for task in self.items.values():
+            by_status[task.status].append(task)
+            
         for status in TaskStatus:
-            tasks_in_status = [t for t in self.items.values() if t.status == status]
+            tasks_in_status = by_status.get(status)
             if not tasks_in_status:
                 continue
                 
-            lines.append(f"\n## {status.value.replace('_', ' ').title()}\n")
+            lines.append(_STATUS_HEADERS[status])
+            prefixes = _TASK_LINE_PREFIXES[status]
             
             for task in tasks_in_status:
-                checkbox = "x" if task.status == TaskStatus.COMPLETED else " "
-                priority_marker = "!" * task.priority.value
-                lines.append(f"- [{checkbox}] {priority_marker} {task.title}")
+                lines.append(prefixes[task.priority] + task.title)
                 
                 if task.description:
-                    lines.append(f"  - {task.description}")
+                    lines.append("  - " + task.description)
                     
                 if task.assigned_to:
-                    lines.append(f"  - Assigned to: {task.assigned_to}")
+                    lines.append("  - Assigned to: " + task.assigned_to)
                     
                 if task.dependencies:
-                    deps = ", ".join(task.dependencies)
-                    lines.append(f"  - Dependencies: {deps}")
+                    lines.append("  - Dependencies: " + ", ".join(task.dependencies))
                     
                 if task.notes:
                     lines.append("  - Notes:")
-                    for note in task.notes:
-                        lines.append(f"    - {note}")
+                    lines.extend("    - " + note for note in task.notes)
                         
         # Add summary
         summary = self.get_task_summary()
@@ -193,14 +282,33 @@ class TodoList:
         
         return "\n".join(lines)
     
-    def clear_completed(self):
-        """Remove completed tasks from the list."""
-        completed_ids = [
-            task_id for task_id, task in self.items.items()
+    def pop_completed(self) -> List[TodoItem]:
+        """
+        Remove completed tasks from the list and return them.
+        They stay counted in get_task_summary until clear_completed is called.
+        """
+        completed = [
+            task for task in self.items.values()
             if task.status == TaskStatus.COMPLETED
         ]
         
-        for task_id in completed_ids:
-            del self.items[task_id]
+        # Removed tasks count as met for their dependents, which were already
+        # released when these tasks completed
+        for task in completed:
+            del self.items[task.id]
+            del self._remaining_deps[task.id]
+            del self._creation_order[task.id]
+            self._dependents.pop(task.id, None)
             
-        logger.debug(f"Cleared {len(completed_ids)} completed tasks")
+        if completed:
+            self._status_counts[TaskStatus.COMPLETED] -= len(completed)
+            self._evicted_completed += len(completed)
+            self._version += 1
+        return completed
+    
+    def clear_completed(self):
+        """Remove completed tasks from the list and drop them from the summary."""
+        completed = self.pop_completed()
+        self._evicted_completed = 0
+        self._version += 1
+        logger.debug(f"Cleared {len(completed)} completed tasks")
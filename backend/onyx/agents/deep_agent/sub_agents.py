@@ -2,18 +2,41 @@
 Sub-agent management for Deep Agent.
 """
 
+import asyncio
+import inspect
+import itertools
+import time
 import uuid
-from typing import Dict, Any, Optional, List, Callable
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Callable, Awaitable, Deque, Set
 from datetime import datetime
 from enum import Enum
+import orjson
 from pydantic import BaseModel, Field
 
-from onyx.agents.deep_agent.prompts import SUB_AGENT_PROMPT_TEMPLATE
+from onyx.agents.deep_agent import prompts
 from onyx.agents.deep_agent.memory import VirtualFileSystem
 from onyx.utils.logger import setup_logger
 
 logger = setup_logger()
 
+# (epoch second, ISO text for that second), reused by log lines within the same second
+_log_second: tuple[int, str] = (-1, "")
+
+
+def _log_timestamp() -> str:
+    """Local ISO 8601 timestamp with microseconds for sub-agent log lines."""
+    global _log_second
+    now = time.time()
+    second = int(now)
+    # Read the shared tuple once; other threads may replace it concurrently
+    cached = _log_second
+    if cached[0] != second:
+        cached = (second, datetime.fromtimestamp(second).isoformat())
+        _log_second = cached
+    return f"{cached[1]}.{int((now - second) * 1_000_000):06d}"
+
 
 class SubAgentStatus(Enum):
     """Status of a sub-agent."""
@@ -42,9 +65,11 @@ class SubAgentConfig(BaseModel):
     context: Dict[str, Any] = Field(default_factory=dict, description="Context from parent")
     max_iterations: int = Field(default=10, description="Maximum iterations allowed")
     timeout_seconds: int = Field(default=300, description="Timeout in seconds")
+    max_log_lines: int = Field(default=1000, description="Most recent log lines kept")
     
     
-class SubAgentResult(BaseModel):
+@dataclass(slots=True)
+class SubAgentResult:
     """Result from a sub-agent execution."""
     agent_id: str
     status: SubAgentStatus
@@ -52,73 +77,125 @@ class SubAgentResult(BaseModel):
     error: Optional[str] = None
     execution_time: float = 0.0
     iterations: int = 0
-    logs: List[str] = Field(default_factory=list)
+    logs: List[str] = field(default_factory=list)
     
 
 class SubAgent:
     """Individual sub-agent instance."""
     
+    __slots__ = (
+        "id",
+        "config",
+        "filesystem",
+        "execute_func",
+        "_status",
+        "_on_status_change",
+        "created_at",
+        "started_at",
+        "completed_at",
+        "logs",
+        "result",
+        "error",
+        "iterations",
+        "_t0",
+        "_prompt_cache",
+        "workspace_path",
+        "_workspace_prefix",
+    )
+    
     def __init__(
         self,
         config: SubAgentConfig,
         filesystem: VirtualFileSystem,
-        execute_func: Optional[Callable] = None
+        execute_func: Optional[Callable] = None,
+        on_status_change: Optional[Callable[["SubAgent", SubAgentStatus, SubAgentStatus], None]] = None
     ):
         self.id = str(uuid.uuid4())
         self.config = config
         self.filesystem = filesystem
         self.execute_func = execute_func
-        self.status = SubAgentStatus.IDLE
+        self._status = SubAgentStatus.IDLE
+        # Called with (agent, old_status, new_status) on every status change
+        self._on_status_change = on_status_change
         self.created_at = datetime.now()
         self.started_at: Optional[datetime] = None
         self.completed_at: Optional[datetime] = None
-        self.logs: List[str] = []
+        self.logs: Deque[str] = deque(maxlen=config.max_log_lines)
         self.result: Optional[Any] = None
         self.error: Optional[str] = None
         self.iterations = 0
+        self._t0 = 0.0
+        # Rendered prompt; the config is not changed after creation except
+        # through update_context, which clears this
+        self._prompt_cache: Optional[str] = None
         
         # Create dedicated workspace
         self.workspace_path = f"/subagents/{self.id}"
+        self._workspace_prefix = self.workspace_path + "/"
         self.filesystem.create_directory(self.workspace_path)
         
+    @property
+    def status(self) -> SubAgentStatus:
+        return self._status
+    
+    @status.setter
+    def status(self, new_status: SubAgentStatus):
+        old_status = self._status
+        self._status = new_status
+        if self._on_status_change and old_status != new_status:
+            self._on_status_change(self, old_status, new_status)
+            
     def log(self, message: str):
         """Add a log message."""
-        timestamp = datetime.now().isoformat()
-        log_entry = f"[{timestamp}] {message}"
-        self.logs.append(log_entry)
+        self.logs.append(f"[{_log_timestamp()}] {message}")
         logger.debug(f"SubAgent {self.id}: {message}")
         
     def get_prompt(self) -> str:
         """Generate the prompt for this sub-agent."""
+        if self._prompt_cache is not None:
+            return self._prompt_cache
+            
         objectives_str = "\n".join(f"- {obj}" for obj in self.config.objectives)
         context_str = "\n".join(f"- {k}: {v}" for k, v in self.config.context.items())
         
-        return SUB_AGENT_PROMPT_TEMPLATE.format(
+        self._prompt_cache = prompts.render_prompt(
+            "SUB_AGENT_PROMPT_TEMPLATE",
             task_description=self.config.task_description,
             objectives=objectives_str,
             context=context_str
         )
+        return self._prompt_cache
+    
+    def update_context(self, **context: Any):
+        """Add or replace context entries passed from the parent agent."""
+        self.config.context.update(context)
+        self._prompt_cache = None
     
     def save_to_workspace(self, filename: str, content: str) -> bool:
         """Save content to the agent's workspace."""
-        filepath = f"{self.workspace_path}/{filename}"
-        return self.filesystem.write_file(filepath, content)
+        return self.filesystem.write_file(self._workspace_prefix + filename, content)
     
     def read_from_workspace(self, filename: str) -> Optional[str]:
         """Read content from the agent's workspace."""
-        filepath = f"{self.workspace_path}/{filename}"
-        return self.filesystem.read_file(filepath)
+        return self.filesystem.read_file(self._workspace_prefix + filename)
     
     async def execute(self) -> SubAgentResult:
         """Execute the sub-agent task."""
         self.status = SubAgentStatus.RUNNING
         self.started_at = datetime.now()
+        # Elapsed time is measured on the monotonic clock, immune to wall-clock jumps
+        self._t0 = time.monotonic()
         self.log(f"Starting execution: {self.config.task_description}")
         
         try:
             if self.execute_func:
-                # Use custom execution function if provided
-                self.result = await self.execute_func(self)
+                # Use custom execution function if provided. It runs on the loop
+                # (the file system is not thread-safe); anything awaitable it
+                # returns is awaited, which covers async callables and partials.
+                result = self.execute_func(self)
+                if inspect.isawaitable(result):
+                    result = await result
+                self.result = result
             else:
                 # Default execution logic
                 self.result = await self._default_execute()
@@ -126,6 +203,14 @@ class SubAgent:
             self.status = SubAgentStatus.COMPLETED
             self.log("Execution completed successfully")
             
+        except asyncio.CancelledError:
+            # Cancelled from outside, e.g. by a timeout; leave a terminal status so
+            # the agent stops counting as active, then let the cancellation through
+            self.status = SubAgentStatus.FAILED
+            self.error = "Execution cancelled"
+            self.log("Execution cancelled")
+            raise
+            
         except Exception as e:
             self.status = SubAgentStatus.FAILED
             self.error = str(e)
@@ -133,7 +218,7 @@ class SubAgent:
             
         finally:
             self.completed_at = datetime.now()
-            execution_time = (self.completed_at - self.started_at).total_seconds()
+            execution_time = time.monotonic() - self._t0
             
             # Save execution summary
             summary = {
@@ -144,21 +229,23 @@ class SubAgent:
                 "error": self.error,
                 "execution_time": execution_time,
                 "iterations": self.iterations,
-                "logs": self.logs
+                "logs": list(self.logs)
             }
             
-            import json
-            self.save_to_workspace("execution_summary.json", json.dumps(summary, indent=2))
-            
-            return SubAgentResult(
-                agent_id=self.id,
-                status=self.status,
-                result=self.result,
-                error=self.error,
-                execution_time=execution_time,
-                iterations=self.iterations,
-                logs=self.logs
+            self.save_to_workspace(
+                "execution_summary.json",
+                orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode()
             )
+            
+        return SubAgentResult(
+            agent_id=self.id,
+            status=self.status,
+            result=self.result,
+            error=self.error,
+            execution_time=execution_time,
+            iterations=self.iterations,
+            logs=list(self.logs)
+        )
     
     async def _default_execute(self) -> Any:
         """Default execution logic for sub-agents."""
@@ -166,16 +253,17 @@ class SubAgent:
         # In practice, this would integrate with the existing agent system
         self.log("Executing default sub-agent logic")
         
-        # Simulate some work
+        # Simulate some work, buffering intermediate results for one batched write
+        iteration_files: Dict[str, str] = {}
         for i in range(min(3, self.config.max_iterations)):
             self.iterations += 1
             self.log(f"Iteration {self.iterations}")
-            
-            # Save intermediate results
-            self.save_to_workspace(
-                f"iteration_{self.iterations}.txt",
+            iteration_files[f"{self._workspace_prefix}iteration_{self.iterations}.txt"] = (
                 f"Results from iteration {self.iterations}"
             )
+            
+        # Save intermediate results
+        self.filesystem.write_files(iteration_files)
         
         return f"Completed {self.config.task_description}"
     
@@ -183,10 +271,38 @@ class SubAgent:
 class SubAgentManager:
     """Manager for coordinating multiple sub-agents."""
     
-    def __init__(self, filesystem: VirtualFileSystem):
+    def __init__(
+        self,
+        filesystem: VirtualFileSystem,
+        max_concurrency: int = 8,
+        max_concurrency_per_type: Optional[int] = None,
+        history_limit: int = 10_000
+    ):
         self.filesystem = filesystem
+        # Make sure the shared workspace root exists up front (it may be missing
+        # after an import), so each agent only adds its own leaf directory
+        if self.filesystem is not None:
+            self.filesystem.create_directory("/subagents")
+        # Bound how many agents hit the shared LLM backend at once. Each type is
+        # also capped (by default at half the global limit) so a burst of one
+        # type cannot hold every slot and starve the others.
+        per_type = max_concurrency_per_type or max(1, (max_concurrency + 1) // 2)
+        self._global_sem = asyncio.Semaphore(max_concurrency)
+        self._type_sems: Dict[SubAgentType, asyncio.Semaphore] = {
+            agent_type: asyncio.Semaphore(per_type) for agent_type in SubAgentType
+        }
+        self.waiting_count = 0
+        self.running_count = 0
         self.agents: Dict[str, SubAgent] = {}
-        self.execution_history: List[SubAgentResult] = []
+        # IDs of managed agents by status, kept current by the agents' status hook
+        self._by_status: Dict[SubAgentStatus, Set[str]] = {status: set() for status in SubAgentStatus}
+        # Most recent results only, so long-lived managers do not grow without bound
+        self.execution_history: Deque[SubAgentResult] = deque(maxlen=history_limit)
+        self._execution_count = 0
+        # Bumped whenever agents or their statuses change through the manager;
+        # get_summary_cached recomputes only when it changes
+        self._version = 0
+        self._summary_cache: Optional[tuple[int, Dict[str, Any]]] = None
         
     def create_agent(
         self,
@@ -195,10 +311,18 @@ class SubAgentManager:
         task_description: str,
         objectives: List[str],
         context: Optional[Dict[str, Any]] = None,
-        execute_func: Optional[Callable] = None
+        execute_func: Optional[Callable] = None,
+        trusted: bool = False
     ) -> SubAgent:
-        """Create a new sub-agent."""
-        config = SubAgentConfig(
+        """
+        Create a new sub-agent.
+        
+        Pass trusted=True only when the arguments are already known to be valid
+        (e.g. built internally by the parent agent); the config is then
+        constructed without Pydantic validation.
+        """
+        config_cls = SubAgentConfig.model_construct if trusted else SubAgentConfig
+        config = config_cls(
             name=name,
             type=type,
             task_description=task_description,
@@ -206,12 +330,27 @@ class SubAgentManager:
             context=context or {}
         )
         
-        agent = SubAgent(config, self.filesystem, execute_func)
+        agent = SubAgent(config, self.filesystem, execute_func, self._on_agent_status_change)
         self.agents[agent.id] = agent
+        self._by_status[agent.status].add(agent.id)
+        self._version += 1
         
         logger.info(f"Created sub-agent {agent.id} ({name}) for: {task_description}")
         return agent
     
+    def _on_agent_status_change(
+        self,
+        agent: SubAgent,
+        old_status: SubAgentStatus,
+        new_status: SubAgentStatus
+    ):
+        """Move an agent between status buckets."""
+        self._by_status[old_status].discard(agent.id)
+        # Agents already removed by cleanup_completed are no longer tracked
+        if agent.id in self.agents:
+            self._by_status[new_status].add(agent.id)
+        self._version += 1
+    
     async def execute_agent(self, agent_id: str) -> Optional[SubAgentResult]:
         """Execute a specific sub-agent."""
         if agent_id not in self.agents:
@@ -219,33 +358,84 @@ class SubAgentManager:
             return None
             
         agent = self.agents[agent_id]
-        result = await agent.execute()
+        
+        # Take the type slot first so a waiting agent never holds a global slot
+        self.waiting_count += 1
+        started = False
+        try:
+            async with self._type_sems[agent.config.type]:
+                async with self._global_sem:
+                    self.waiting_count -= 1
+                    started = True
+                    self.running_count += 1
+                    try:
+                        result = await agent.execute()
+                    finally:
+                        self.running_count -= 1
+        finally:
+            if not started:
+                self.waiting_count -= 1
+                
         self.execution_history.append(result)
+        self._execution_count += 1
+        self._version += 1
         
         return result
     
     async def execute_parallel(
         self,
-        agent_ids: List[str]
+        agent_ids: List[str],
+        on_result: Optional[Callable[[str, SubAgentResult], Awaitable[None]]] = None
     ) -> Dict[str, SubAgentResult]:
-        """Execute multiple sub-agents in parallel."""
-        import asyncio
+        """
+        Execute multiple sub-agents in parallel.
+        If on_result is given it is awaited for each result as soon as that agent
+        finishes, so callers can aggregate without waiting for the slowest one.
+        """
+        async def _run(agent_id: str) -> tuple[str, Optional[SubAgentResult]]:
+            # Isolate failures so one agent cannot take down its siblings
+            try:
+                return agent_id, await self.execute_agent(agent_id)
+            except Exception as e:
+                logger.error(f"Sub-agent {agent_id} raised during execution: {e}")
+                return agent_id, None
         
         tasks = []
         for agent_id in agent_ids:
             if agent_id in self.agents:
-                tasks.append(self.execute_agent(agent_id))
+                tasks.append(asyncio.create_task(_run(agent_id)))
             else:
                 logger.warning(f"Agent {agent_id} not found, skipping")
                 
-        results = await asyncio.gather(*tasks)
-        
+        results: Dict[str, SubAgentResult] = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                agent_id, result = await next_done
+                if result is None:
+                    continue
+                results[agent_id] = result
+                if on_result:
+                    await on_result(agent_id, result)
+        finally:
+            for task in tasks:
+                task.cancel()
+                
+        # Report in request order regardless of completion order
         return {
-            agent_id: result
-            for agent_id, result in zip(agent_ids, results)
-            if result is not None
+            agent_id: results[agent_id]
+            for agent_id in agent_ids
+            if agent_id in results
         }
     
+    def run_in_background(self, agent_id: str) -> "asyncio.Task[Optional[SubAgentResult]]":
+        """Start a sub-agent without waiting for it and return its task."""
+        return asyncio.create_task(self.execute_agent(agent_id))
+    
+    def get_history(self, offset: int = 0, limit: Optional[int] = None) -> List[SubAgentResult]:
+        """Get retained execution results, oldest first."""
+        stop = None if limit is None else offset + limit
+        return list(itertools.islice(self.execution_history, offset, stop))
+    
     def get_agent_status(self, agent_id: str) -> Optional[SubAgentStatus]:
         """Get the status of a sub-agent."""
         if agent_id in self.agents:
@@ -260,10 +450,7 @@ class SubAgentManager:
     
     def get_active_agents(self) -> List[SubAgent]:
         """Get all currently active sub-agents."""
-        return [
-            agent for agent in self.agents.values()
-            if agent.status == SubAgentStatus.RUNNING
-        ]
+        return [self.agents[agent_id] for agent_id in self._by_status[SubAgentStatus.RUNNING]]
     
     def cancel_agent(self, agent_id: str) -> bool:
         """Cancel a running sub-agent."""
@@ -277,25 +464,30 @@ class SubAgentManager:
     
     def cleanup_completed(self):
         """Remove completed agents from memory."""
-        completed_ids = [
-            agent_id for agent_id, agent in self.agents.items()
-            if agent.status in [SubAgentStatus.COMPLETED, SubAgentStatus.FAILED, SubAgentStatus.CANCELLED]
-        ]
-        
+        completed_ids = []
+        for status in (SubAgentStatus.COMPLETED, SubAgentStatus.FAILED, SubAgentStatus.CANCELLED):
+            completed_ids.extend(self._by_status[status])
+            self._by_status[status].clear()
+            
         for agent_id in completed_ids:
             del self.agents[agent_id]
             
+        if completed_ids:
+            self._version += 1
+            
         logger.debug(f"Cleaned up {len(completed_ids)} completed agents")
     
     def get_summary(self) -> Dict[str, Any]:
         """Get a summary of all sub-agents."""
-        status_counts = {status: 0 for status in SubAgentStatus}
-        for agent in self.agents.values():
-            status_counts[agent.status] += 1
-            
         return {
             "total_agents": len(self.agents),
-            "status_breakdown": {s.value: c for s, c in status_counts.items()},
-            "active_agents": len(self.get_active_agents()),
-            "execution_history_count": len(self.execution_history)
+            "status_breakdown": {s.value: len(ids) for s, ids in self._by_status.items()},
+            "active_agents": len(self._by_status[SubAgentStatus.RUNNING]),
+            "execution_history_count": self._execution_count
         }
+    
+    def get_summary_cached(self) -> Dict[str, Any]:
+        """Get the sub-agent summary, recomputing it only after a change."""
+        if self._summary_cache is None or self._summary_cache[0] != self._version:
+            self._summary_cache = (self._version, self.get_summary())
+        return self._summary_cache[1]
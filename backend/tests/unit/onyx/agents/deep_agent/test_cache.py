@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from onyx.agents.deep_agent.cache import InMemoryLLMResponseCache
+from onyx.agents.deep_agent.cache import prompt_cache_key
+from onyx.agents.deep_agent.core import DeepAgent
+from onyx.agents.deep_agent.core import DeepAgentConfig
+from onyx.llm.interfaces import LLMConfig
+
+
+@pytest.mark.asyncio
+async def test_in_memory_cache_evicts_least_recently_used() -> None:
+    cache = InMemoryLLMResponseCache(max_entries=2)
+    await cache.aupdate("a", "model", "A")
+    await cache.aupdate("b", "model", "B")
+    assert await cache.alookup("a", "model") == "A"
+
+    await cache.aupdate("c", "model", "C")
+
+    assert await cache.alookup("b", "model") is None
+    assert await cache.alookup("a", "model") == "A"
+    assert await cache.alookup("c", "model") == "C"
+    assert await cache.alookup("a", "other model") is None
+
+
+def test_prompt_cache_key_is_exact() -> None:
+    assert prompt_cache_key("plan this") == prompt_cache_key("plan this")
+    assert prompt_cache_key("plan this") != prompt_cache_key("plan this ")
+
+
+def _fake_llm() -> MagicMock:
+    llm = MagicMock()
+    llm.config = LLMConfig(
+        model_provider="openai",
+        model_name="gpt-4o",
+        temperature=0.0,
+        api_key="secret",
+        max_input_tokens=1000,
+    )
+    llm.invoke.return_value = SimpleNamespace(content="- Step one")
+    llm.stream.side_effect = lambda prompt: iter([SimpleNamespace(content="answer")])
+    return llm
+
+
+async def _run(agent: DeepAgent, temperature: float | None = None) -> str:
+    context = {"temperature_override": temperature} if temperature is not None else None
+    updates = [update async for update in agent.process("query", context)]
+    return updates[-1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_response_cache_is_opt_in() -> None:
+    llm = _fake_llm()
+    agent = DeepAgent(llm=llm, tools=[])
+
+    await _run(agent)
+    await _run(agent)
+
+    assert llm.invoke.call_count == 2
+    assert llm.stream.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_response_cache_replays_only_matching_generation_params() -> None:
+    llm = _fake_llm()
+    cache = InMemoryLLMResponseCache()
+    agent = DeepAgent(
+        llm=llm,
+        tools=[],
+        config=DeepAgentConfig(enable_response_cache=True, response_cache=cache),
+    )
+
+    assert await _run(agent) == "answer"
+    assert await _run(agent) == "answer"
+    assert llm.invoke.call_count == 1
+    assert llm.stream.call_count == 1
+
+    # A different sampling temperature must not reuse the cached responses
+    await _run(agent, temperature=0.9)
+    assert llm.invoke.call_count == 2
+    assert llm.stream.call_count == 2
+    # Credentials never end up in the cache key
+    assert all("secret" not in llm_string for llm_string, _ in cache._entries)
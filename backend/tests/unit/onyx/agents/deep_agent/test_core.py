@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import MagicMock
+
+import orjson
+import pytest
+
+from onyx.agents.deep_agent.core import DeepAgent
+from onyx.agents.deep_agent.core import DeepAgentConfig
+from onyx.agents.deep_agent.planning import TaskPriority
+from onyx.agents.deep_agent.planning import TaskStatus
+
+
+def _fake_llm(plan: str, answer_chunks: tuple[str, ...] = ("answer",)) -> MagicMock:
+    llm = MagicMock()
+    llm.invoke.return_value = SimpleNamespace(content=plan)
+    llm.stream.side_effect = lambda prompt: iter(
+        SimpleNamespace(content=chunk) for chunk in answer_chunks
+    )
+    return llm
+
+
+async def _collect(agent: DeepAgent, query: str = "query") -> list[dict[str, Any]]:
+    return [update async for update in agent.process(query)]
+
+
+@pytest.mark.asyncio
+async def test_process_runs_ready_batches_concurrently() -> None:
+    plan = "\n".join(f"- Step {i}" for i in range(5))
+    agent = DeepAgent(
+        llm=_fake_llm(plan),
+        tools=[],
+        config=DeepAgentConfig(max_sub_agents=2),
+    )
+    running = 0
+    peak = 0
+
+    async def _fake_execute_task(task_id: str) -> bool:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        assert agent.todo_list is not None
+        agent.todo_list.update_task_status(task_id, TaskStatus.COMPLETED)
+        return True
+
+    agent._execute_task = _fake_execute_task  # type: ignore[method-assign]
+
+    updates = await _collect(agent)
+
+    completed = [update for update in updates if update["type"] == "task_complete"]
+    assert [update["task"] for update in completed] == [f"Step {i}" for i in range(5)]
+    assert all(update["success"] for update in completed)
+    # Each batch runs together, and never more than max_sub_agents at once
+    assert peak == 2
+    assert updates[-1]["type"] == "answer"
+    assert updates[-1]["metadata"]["tasks_completed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_progress_and_summary_across_runs() -> None:
+    agent = DeepAgent(llm=_fake_llm("- Step one\n- Step two"), tools=[])
+
+    await _collect(agent)
+    assert agent.filesystem is not None
+    progress = agent.filesystem.read_file("/research/progress.jsonl")
+    assert progress is not None
+    entries = [orjson.loads(line) for line in progress.splitlines()]
+    # Each entry lists only the tasks completed in its own iteration
+    assert [entry["completed_tasks"] for entry in entries] == [["Step one", "Step two"]]
+    assert entries[0]["todo_summary"]["total_tasks"] == 2
+    assert entries[0]["todo_summary"]["completion_rate"] == 100
+
+    # A second run on the same agent starts from a clean summary
+    await _collect(agent)
+    plan = agent.filesystem.read_file("/research/initial_plan.md")
+    assert plan is not None
+    assert "2 tasks, 0.0% complete" in plan
+
+
+_PLAN_TEXT = """Here is the plan:
+
+1. Research the market
+2) Compare vendors
+  - Critical: check pricing\r
+* Optional summary slide   
+- 2024 roadmap review
+1.
+-
+Closing remarks"""
+
+
+@pytest.mark.asyncio
+async def test_create_plan_parses_list_lines() -> None:
+    agent = DeepAgent(llm=_fake_llm(_PLAN_TEXT), tools=[])
+
+    tasks = await agent._create_plan("query")
+
+    assert [(task["title"], task["priority"]) for task in tasks] == [
+        ("Research the market", TaskPriority.MEDIUM.value),
+        (") Compare vendors", TaskPriority.MEDIUM.value),
+        ("Critical: check pricing", TaskPriority.HIGH.value),
+        ("Optional summary slide", TaskPriority.LOW.value),
+        ("roadmap review", TaskPriority.MEDIUM.value),
+    ]
+    assert agent.todo_list is not None
+    assert [task.id for task in agent.todo_list.items.values()] == [task["id"] for task in tasks]
+
+
+@pytest.mark.asyncio
+async def test_process_streams_answer_chunks() -> None:
+    agent = DeepAgent(llm=_fake_llm("- Step", ("Hello", "", ", wor", "ld.")), tools=[])
+
+    updates = await _collect(agent)
+
+    chunks = [update["content"] for update in updates if update["type"] == "answer_chunk"]
+    assert chunks == ["Hello", ", wor", "ld."]
+    assert updates[-1]["type"] == "answer"
+    assert updates[-1]["content"] == "Hello, world."
+    assert agent.filesystem is not None
+    assert agent.filesystem.read_file("/results/final_answer.md") == "Hello, world."
+
+
+@pytest.mark.asyncio
+async def test_process_reports_stream_errors() -> None:
+    llm = _fake_llm("- Step")
+
+    def _failing_stream(prompt: str) -> Any:
+        yield SimpleNamespace(content="partial")
+        raise RuntimeError("stream broke")
+
+    llm.stream.side_effect = _failing_stream
+    agent = DeepAgent(llm=llm, tools=[])
+
+    updates = await _collect(agent)
+
+    assert [update["type"] for update in updates[-2:]] == ["answer_chunk", "error"]
+    assert updates[-1]["message"] == "stream broke"
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+
+from onyx.agents.deep_agent.integration import DeepAgentIntegration
+from onyx.agents.deep_agent.integration import stream_with_deep_agent
+
+
+def _request(message: str, **flags: bool) -> Any:
+    return SimpleNamespace(
+        message=message,
+        use_deep_agent=flags.get("use_deep_agent", False),
+        use_agentic_search=flags.get("use_agentic_search", False),
+    )
+
+
+@pytest.mark.parametrize(
+    "request_,expected",
+    [
+        (_request("What time is it?"), False),
+        (_request("hi", use_deep_agent=True), True),
+        (_request("hi", use_agentic_search=True), True),
+        (_request("Give me a DEEP DIVE into caching"), True),
+        (_request("List the pros and cons of Rust"), True),
+        (_request(" ".join(["word"] * 50)), False),
+        (_request(" ".join(["word"] * 51)), True),
+        (_request("Why? How? When?"), True),
+        (_request("Why? How?"), False),
+    ],
+)
+def test_should_use_deep_agent(request_: Any, expected: bool) -> None:
+    integration = DeepAgentIntegration(llm=MagicMock(), tools=[])
+    assert integration.should_use_deep_agent(request_) is expected
+
+
+def test_should_use_deep_agent_complexity_score() -> None:
+    integration = DeepAgentIntegration(llm=MagicMock(), tools=[])
+    assert integration.should_use_deep_agent(_request("hi"), query_complexity=0.8)
+    assert not integration.should_use_deep_agent(_request("hi"), query_complexity=0.7)
+
+
+@pytest.mark.asyncio
+async def test_simple_requests_never_build_a_deep_agent(monkeypatch: pytest.MonkeyPatch) -> None:
+    initialize = MagicMock(side_effect=AssertionError("Deep Agent should not be built"))
+    monkeypatch.setattr(DeepAgentIntegration, "_initialize_deep_agent", initialize)
+    request = _request("What time is it?")
+
+    integration = DeepAgentIntegration(llm=MagicMock(), tools=[])
+    assert [packet async for packet in integration.process_with_deep_agent(request)] == []
+    assert [
+        packet async for packet in stream_with_deep_agent(request, MagicMock(), [])
+    ] == []
+    initialize.assert_not_called()
@@ -0,0 +1,150 @@
+from datetime import date
+
+from onyx.agents.deep_agent.memory import VirtualFileSystem
+
+
+def test_export_import_round_trip() -> None:
+    fs = VirtualFileSystem()
+    fs.create_directory("/research/deep")
+    fs.write_file("/research/deep/notes.md", "nested", metadata={"source": "test"})
+    fs.write_file("/results/answer.md", "answer")
+    fs.append_to_file("/results/answer.md", "more")
+
+    restored = VirtualFileSystem()
+    restored.import_from_json(fs.export_to_json())
+
+    assert restored.export_to_json() == fs.export_to_json()
+    assert restored.get_summary() == fs.get_summary()
+    assert restored.read_file("/research/deep/notes.md") == "nested"
+    assert restored.read_file("/results/answer.md") == "answer\nmore"
+    metadata = restored.get_file_metadata("/research/deep/notes.md")
+    assert metadata is not None
+    assert metadata == fs.get_file_metadata("/research/deep/notes.md")
+    assert restored.search_files("notes") == ["/research/deep/notes.md"]
+
+    # The indexes are rebuilt, so new writes land in imported directories
+    assert restored.write_file("/research/deep/more.md", "x")
+    assert restored.get_summary()["total_files"] == 3
+
+
+def test_export_handles_non_string_metadata() -> None:
+    fs = VirtualFileSystem()
+    fs.write_file("/notes/page.md", "x", metadata={1: "page", "when": date(2024, 1, 2)})
+
+    restored = VirtualFileSystem()
+    restored.import_from_json(fs.export_to_json())
+
+    metadata = restored.get_file_metadata("/notes/page.md")
+    assert metadata is not None
+    assert metadata["metadata"] == {"1": "page", "when": "2024-01-02"}
+
+
+def test_paths_resolve_through_the_index() -> None:
+    fs = VirtualFileSystem()
+    assert fs.create_directory("/research/deep")
+    assert not fs.create_directory("/research/deep")
+    assert not fs.create_directory("/missing/child")
+    assert fs.write_file("/research/deep/findings.md", "abc")
+
+    assert fs.change_directory("/research")
+    assert fs.read_file("deep/findings.md") == "abc"
+    assert fs.read_file("../research/./deep/findings.md") == "abc"
+
+    listing = fs.list_directory("/research")
+    assert listing is not None
+    assert list(listing["directories"]) == ["deep"]
+    assert list(fs.list_directory("deep")["files"]) == ["findings.md"]  # type: ignore[index]
+
+    assert fs.delete_file("/research/deep/findings.md")
+    assert fs.read_file("/research/deep/findings.md") is None
+    assert not fs.delete_file("/research/deep/findings.md")
+
+
+def test_write_to_missing_directory_fails() -> None:
+    fs = VirtualFileSystem()
+    assert not fs.write_file("/missing/file.txt", "x")
+    assert fs.read_file("/missing/file.txt") is None
+
+
+def test_summary_counters_follow_mutations() -> None:
+    fs = VirtualFileSystem()
+    base_dirs = fs.get_summary()["total_directories"]
+
+    fs.create_directory("/notes/sub")
+    fs.write_file("/notes/sub/a.md", "abc")
+    fs.write_file("/notes/sub/a.md", "abcdef")
+    fs.write_file("/notes/b.md", "xy")
+    fs.change_directory("/notes")
+    assert fs.get_summary() == {
+        "total_files": 2,
+        "total_directories": base_dirs + 1,
+        "total_size_bytes": 8,
+        "current_directory": "/notes",
+    }
+
+    fs.delete_file("/notes/sub/a.md")
+    summary = fs.get_summary_cached()
+    assert summary["total_files"] == 1
+    assert summary["total_size_bytes"] == 2
+
+
+def test_append_to_file() -> None:
+    fs = VirtualFileSystem()
+    assert fs.append_to_file("/notes/log.txt", "one")
+    assert fs.append_to_file("/notes/log.txt", "two")
+    assert fs.append_to_file("/notes/log.txt", "three")
+    assert fs.read_file("/notes/log.txt") == "one\ntwo\nthree"
+    assert fs.get_summary()["total_size_bytes"] == len("one\ntwo\nthree")
+
+    # Rewriting replaces the appended chunks
+    assert fs.write_file("/notes/log.txt", "fresh")
+    assert fs.read_file("/notes/log.txt") == "fresh"
+    assert fs.get_summary()["total_size_bytes"] == 5
+
+
+def test_write_files_updates_totals_once_per_batch() -> None:
+    fs = VirtualFileSystem()
+    fs.write_file("/temp/a.txt", "old")
+    version = fs._version
+
+    assert fs.write_files({"/temp/a.txt": "new!", "/temp/b.txt": "bb"})
+    assert fs._version == version + 1
+    assert fs.read_file("/temp/a.txt") == "new!"
+    assert fs.read_file("/temp/b.txt") == "bb"
+
+    summary = fs.get_summary()
+    assert summary["total_files"] == 2
+    assert summary["total_size_bytes"] == 6
+
+    # A failing write does not stop the rest of the batch
+    assert not fs.write_files({"/missing/c.txt": "c", "/temp/d.txt": "d"})
+    assert fs.read_file("/temp/d.txt") == "d"
+    assert fs.get_summary()["total_files"] == 3
+    assert fs.search_files("d.txt") == ["/temp/d.txt"]
+
+
+def test_search_files() -> None:
+    fs = VirtualFileSystem()
+    fs.write_file("/research/Key_Findings.md", "x")
+    fs.write_file("/notes/findings_draft.md", "y")
+    fs.write_file("/notes/other.md", "z")
+
+    assert fs.search_files("findings") == [
+        "/research/Key_Findings.md",
+        "/notes/findings_draft.md",
+    ]
+    assert fs.search_files("FINDINGS", "/notes") == ["/notes/findings_draft.md"]
+    assert fs.search_files("other", "/research") == []
+    assert fs.search_files("findings", "/missing") == []
+    # No filename has these trigrams, so the Bloom filter rejects them outright
+    assert not fs._name_bloom_may_match("zzzqqq")
+    assert fs.search_files("zzzqqq") == []
+    # Patterns shorter than a trigram always fall through to the walk
+    assert fs.search_files("md") == [
+        "/research/Key_Findings.md",
+        "/notes/findings_draft.md",
+        "/notes/other.md",
+    ]
+
+    fs.delete_file("/notes/findings_draft.md")
+    assert fs.search_files("findings") == ["/research/Key_Findings.md"]
@@ -0,0 +1,107 @@
+from onyx.agents.deep_agent.planning import TaskPriority
+from onyx.agents.deep_agent.planning import TaskStatus
+from onyx.agents.deep_agent.planning import TodoList
+
+
+def test_pop_completed_keeps_summary_counts_until_cleared() -> None:
+    todo_list = TodoList()
+    tasks = [todo_list.add_task(f"task {i}") for i in range(3)]
+    for task in tasks[:2]:
+        todo_list.update_task_status(task.id, TaskStatus.COMPLETED)
+
+    popped = todo_list.pop_completed()
+
+    assert [task.id for task in popped] == [tasks[0].id, tasks[1].id]
+    assert list(todo_list.items) == [tasks[2].id]
+
+    summary = todo_list.get_task_summary()
+    assert summary["total_tasks"] == 3
+    assert summary["status_breakdown"]["completed"] == 2
+    assert summary["status_breakdown"]["pending"] == 1
+    assert summary["ready_tasks"] == 1
+    assert round(summary["completion_rate"], 1) == 66.7
+
+    todo_list.update_task_status(tasks[2].id, TaskStatus.COMPLETED)
+    todo_list.pop_completed()
+    assert todo_list.get_task_summary_cached()["completion_rate"] == 100
+
+    todo_list.clear_completed()
+    assert not todo_list.items
+    summary = todo_list.get_task_summary_cached()
+    assert summary["total_tasks"] == 0
+    assert summary["completion_rate"] == 0
+
+    todo_list.add_task("next run")
+    assert "1 tasks, 0.0% complete" in todo_list.to_markdown()
+
+
+def _titles(todo_list: TodoList, limit: int | None = None) -> list[str]:
+    return [task.title for task in todo_list.get_ready_tasks(limit=limit)]
+
+
+def test_ready_tasks_wait_for_dependencies() -> None:
+    todo_list = TodoList()
+    first = todo_list.add_task("first")
+    second = todo_list.add_task("second", dependencies=[first.id])
+    todo_list.add_task("third", dependencies=[second.id])
+
+    assert _titles(todo_list) == ["first"]
+
+    todo_list.update_task_status(first.id, TaskStatus.IN_PROGRESS)
+    assert _titles(todo_list) == []
+
+    todo_list.update_task_status(first.id, TaskStatus.COMPLETED)
+    assert _titles(todo_list) == ["second"]
+
+    todo_list.update_task_status(second.id, TaskStatus.COMPLETED)
+    assert _titles(todo_list) == ["third"]
+
+    # Reopening a dependency blocks its dependents again
+    todo_list.update_task_status(second.id, TaskStatus.PENDING)
+    assert _titles(todo_list) == ["second"]
+
+    # Evicted dependencies count as met
+    todo_list.update_task_status(second.id, TaskStatus.COMPLETED)
+    todo_list.pop_completed()
+    assert _titles(todo_list) == ["third"]
+
+
+def test_dependency_added_before_its_task_exists() -> None:
+    todo_list = TodoList()
+    waiting = todo_list.add_task("waiting", dependencies=["task_2"])
+    assert _titles(todo_list) == ["waiting"]
+
+    todo_list.add_task("dependency")
+    assert _titles(todo_list) == ["dependency"]
+    assert waiting.status == TaskStatus.PENDING
+
+
+def test_ready_tasks_ordered_by_priority_then_creation() -> None:
+    todo_list = TodoList()
+    todo_list.add_task("low", priority=TaskPriority.LOW)
+    todo_list.add_task("medium 1")
+    high = todo_list.add_task("high", priority=TaskPriority.HIGH)
+    todo_list.add_task("medium 2")
+
+    assert _titles(todo_list) == ["high", "medium 1", "medium 2", "low"]
+    assert _titles(todo_list, limit=2) == ["high", "medium 1"]
+    # Reading the ready tasks does not consume them
+    assert _titles(todo_list, limit=2) == ["high", "medium 1"]
+
+    # Tasks that stop being ready are skipped, and come back when pending again
+    todo_list.update_task_status(high.id, TaskStatus.IN_PROGRESS)
+    assert _titles(todo_list, limit=2) == ["medium 1", "medium 2"]
+    todo_list.update_task_status(high.id, TaskStatus.PENDING)
+    assert _titles(todo_list, limit=1) == ["high"]
+
+
+def test_status_values_are_strings() -> None:
+    assert [status.value for status in TaskStatus] == [
+        "pending",
+        "in_progress",
+        "completed",
+        "blocked",
+        "cancelled",
+    ]
+    assert TaskStatus.IN_PROGRESS != TaskPriority.LOW
+    assert TaskPriority.HIGH > TaskPriority.MEDIUM
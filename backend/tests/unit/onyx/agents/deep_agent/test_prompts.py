@@ -0,0 +1,32 @@
+import pytest
+
+from onyx.agents.deep_agent import prompts
+
+
+@pytest.mark.parametrize(
+    "name,values",
+    [
+        (
+            "SUB_AGENT_PROMPT_TEMPLATE",
+            {
+                "task_description": "Survey {braces} in input",
+                "objectives": "- first\n- second",
+                "context": "- parent_query: q",
+            },
+        ),
+        ("PLANNING_PROMPT", {"query": "Compare A and B"}),
+    ],
+)
+def test_render_prompt_matches_str_format(name: str, values: dict[str, str]) -> None:
+    template = getattr(prompts, name)
+    assert prompts.render_prompt(name, **values) == template.format(**values)
+
+
+def test_render_prompt_requires_every_field() -> None:
+    with pytest.raises(KeyError):
+        prompts.render_prompt("PLANNING_PROMPT")
+
+
+def test_unknown_prompt() -> None:
+    with pytest.raises(AttributeError):
+        prompts.NOT_A_PROMPT
@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import threading
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+
+from onyx.agents.deep_agent.core import DeepAgent
+from onyx.agents.deep_agent.core import DeepAgentConfig
+from onyx.agents.deep_agent.memory import VirtualFileSystem
+from onyx.agents.deep_agent.planning import TaskStatus
+from onyx.agents.deep_agent.sub_agents import SubAgent
+from onyx.agents.deep_agent.sub_agents import SubAgentManager
+from onyx.agents.deep_agent.sub_agents import SubAgentStatus
+from onyx.agents.deep_agent.sub_agents import SubAgentType
+
+
+async def _slow_execute(self: SubAgent) -> str:
+    await asyncio.sleep(10)
+    return "never"
+
+
+def _create(manager: SubAgentManager, execute_func: Any = None, **kwargs: Any) -> SubAgent:
+    return manager.create_agent(
+        name=kwargs.pop("name", "test"),
+        type=kwargs.pop("type", SubAgentType.RESEARCH),
+        task_description=kwargs.pop("task_description", "test task"),
+        objectives=["objective"],
+        execute_func=execute_func,
+    )
+
+
+class _ConcurrencyTracker:
+    """execute_func that records the peak number of concurrently running agents."""
+
+    def __init__(self) -> None:
+        self.running: dict[SubAgentType, int] = {agent_type: 0 for agent_type in SubAgentType}
+        self.peaks: dict[Any, int] = {"total": 0, **self.running}
+
+    async def __call__(self, sub_agent: SubAgent) -> str:
+        agent_type = sub_agent.config.type
+        self.running[agent_type] += 1
+        self.peaks[agent_type] = max(self.peaks[agent_type], self.running[agent_type])
+        self.peaks["total"] = max(self.peaks["total"], sum(self.running.values()))
+        await asyncio.sleep(0.01)
+        self.running[agent_type] -= 1
+        return sub_agent.id
+
+
+@pytest.mark.asyncio
+async def test_execute_parallel_respects_concurrency_limits() -> None:
+    manager = SubAgentManager(VirtualFileSystem(), max_concurrency=3, max_concurrency_per_type=2)
+    tracker = _ConcurrencyTracker()
+    agent_ids = [
+        _create(manager, tracker, type=agent_type).id
+        for agent_type in [SubAgentType.RESEARCH] * 4 + [SubAgentType.ANALYSIS] * 4
+    ]
+
+    results = await manager.execute_parallel(agent_ids)
+
+    assert list(results) == agent_ids
+    assert all(result.status == SubAgentStatus.COMPLETED for result in results.values())
+    assert tracker.peaks["total"] == 3
+    assert tracker.peaks[SubAgentType.RESEARCH] == 2
+    assert tracker.peaks[SubAgentType.ANALYSIS] <= 2
+    assert manager.running_count == 0
+    assert manager.waiting_count == 0
+
+
+async def _peak_research_concurrency(manager: SubAgentManager | None, count: int) -> int:
+    assert manager is not None
+    tracker = _ConcurrencyTracker()
+    await manager.execute_parallel([_create(manager, tracker).id for _ in range(count)])
+    return tracker.peaks[SubAgentType.RESEARCH]
+
+
+@pytest.mark.asyncio
+async def test_deep_agent_sizes_its_manager_to_max_sub_agents() -> None:
+    agent = DeepAgent(llm=MagicMock(), tools=[], config=DeepAgentConfig(max_sub_agents=5))
+
+    # Every research agent up to max_sub_agents runs at once, also after a reset
+    assert await _peak_research_concurrency(agent.sub_agent_manager, 6) == 5
+    agent.reset()
+    assert await _peak_research_concurrency(agent.sub_agent_manager, 6) == 5
+
+
+@pytest.mark.asyncio
+async def test_timed_out_sub_agents_are_failed_and_free_their_slot(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(SubAgent, "_default_execute", _slow_execute)
+    agent = DeepAgent(
+        llm=MagicMock(),
+        tools=[],
+        config=DeepAgentConfig(max_sub_agents=1, sub_agent_timeout_seconds=0.05),
+    )
+
+    # Each run times out; the second would be refused if the first stayed RUNNING
+    for _ in range(2):
+        result = await agent._spawn_with_timeout("research", ["research"], {})
+        assert isinstance(result, TimeoutError)
+
+    manager = agent.sub_agent_manager
+    assert manager is not None
+    assert manager.get_active_agents() == []
+    assert manager.running_count == 0
+    statuses = [sub_agent.status for sub_agent in manager.agents.values()]
+    assert statuses == [SubAgentStatus.FAILED, SubAgentStatus.FAILED]
+
+    manager.cleanup_completed()
+    assert manager.agents == {}
+
+
+@pytest.mark.asyncio
+async def test_timed_out_sub_agent_blocks_its_task(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(SubAgent, "_default_execute", _slow_execute)
+    agent = DeepAgent(
+        llm=MagicMock(),
+        tools=[],
+        config=DeepAgentConfig(sub_agent_timeout_seconds=0.05),
+    )
+    assert agent.todo_list is not None
+    task = agent.todo_list.add_task("Research the topic")
+
+    assert not await agent._execute_task(task.id)
+    assert task.status == TaskStatus.BLOCKED
+
+
+@pytest.mark.asyncio
+async def test_cancelled_execution_is_terminal_and_propagates() -> None:
+    manager = SubAgentManager(VirtualFileSystem())
+    sub_agent = _create(manager, _slow_execute)
+
+    task = asyncio.create_task(manager.execute_agent(sub_agent.id))
+    await asyncio.sleep(0.01)
+    assert manager.get_active_agents() == [sub_agent]
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert sub_agent.status == SubAgentStatus.FAILED
+    assert sub_agent.error == "Execution cancelled"
+    assert manager.get_active_agents() == []
+    assert sub_agent.read_from_workspace("execution_summary.json") is not None
+
+
+def test_deep_agent_without_memory() -> None:
+    agent = DeepAgent(llm=MagicMock(), tools=[], config=DeepAgentConfig(enable_memory=False))
+    assert agent.filesystem is None
+    assert agent.sub_agent_manager is not None
+
+
+def test_manager_recreates_the_workspace_root() -> None:
+    fs = VirtualFileSystem()
+    fs.import_from_json('{"path": "/", "files": {}, "subdirectories": {}}')
+    assert fs.list_directory("/subagents") is None
+
+    manager = SubAgentManager(fs)
+    sub_agent = _create(manager)
+    assert fs.list_directory(sub_agent.workspace_path) is not None
+
+
+class _AsyncCallable:
+    async def __call__(self, sub_agent: SubAgent) -> str:
+        return "callable"
+
+
+async def _coroutine_func(sub_agent: SubAgent, value: str) -> str:
+    return value
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "execute_func,expected",
+    [
+        (_AsyncCallable(), "callable"),
+        (functools.partial(_coroutine_func, value="partial"), "partial"),
+        (lambda sub_agent: _coroutine_func(sub_agent, "lambda"), "lambda"),
+        (lambda sub_agent: "sync", "sync"),
+    ],
+)
+async def test_execute_func_results_are_awaited(execute_func: Any, expected: str) -> None:
+    manager = SubAgentManager(VirtualFileSystem())
+    sub_agent = _create(manager, execute_func)
+
+    result = await manager.execute_agent(sub_agent.id)
+
+    assert result is not None
+    assert result.status == SubAgentStatus.COMPLETED
+    assert result.result == expected
+
+
+@pytest.mark.asyncio
+async def test_sync_execute_func_runs_on_the_event_loop_thread() -> None:
+    manager = SubAgentManager(VirtualFileSystem())
+    sub_agent = _create(manager, lambda sub_agent: threading.get_ident())
+
+    result = await manager.execute_agent(sub_agent.id)
+
+    assert result is not None
+    assert result.result == threading.get_ident()
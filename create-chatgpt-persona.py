@@ -4,9 +4,9 @@ Script to create a ChatGPT-like persona in Onyx
 This will configure Onyx to behave like ChatGPT with web search
 """
 
-import requests
-import json
-import sys
+import argparse
+import asyncio
+import httpx
 
 # Configuration
 API_BASE = "http://localhost:8080"
@@ -27,18 +27,21 @@ When answering questions:
 
 You don't need to always search documents. You can answer directly when appropriate."""
 
-def create_persona():
-    """Create a ChatGPT-like persona via API"""
+async def check_health(client):
+    """Check that the API server is reachable"""
     
-    # Check if API is accessible
     try:
-        health = requests.get(f"{API_BASE}/health")
+        health = await client.get("/health")
         if health.status_code != 200:
             print("❌ API server is not accessible. Make sure Onyx is running.")
             return False
-    except:
+    except httpx.HTTPError:
         print("❌ Cannot connect to API server at http://localhost:8080")
         return False
+    return True
+
+async def create_persona(client):
+    """Create a ChatGPT-like persona via API"""
     
     # Create persona payload
     persona_data = {
@@ -79,11 +82,7 @@ def create_persona():
     
     # Try to create persona
     try:
-        response = requests.post(
-            f"{API_BASE}/persona",
-            json=persona_data,
-            headers={"Content-Type": "application/json"}
-        )
+        response = await client.post("/persona", json=persona_data)
         
         if response.status_code in [200, 201]:
             print(f"✅ Created '{PERSONA_NAME}' persona successfully!")
@@ -96,7 +95,7 @@ def create_persona():
         print(f"❌ Error creating persona: {e}")
         return False
 
-def configure_search_settings():
+async def configure_search_settings(client):
     """Configure search settings for ChatGPT-like behavior"""
     
     settings = {
@@ -108,11 +107,7 @@ def configure_search_settings():
     }
     
     try:
-        response = requests.put(
-            f"{API_BASE}/admin/search-settings",
-            json=settings,
-            headers={"Content-Type": "application/json"}
-        )
+        response = await client.put("/admin/search-settings", json=settings)
         
         if response.status_code == 200:
             print("✅ Search settings configured for ChatGPT mode")
@@ -124,13 +119,38 @@ def configure_search_settings():
         print(f"⚠️ Error updating search settings: {e}")
         return False
 
+async def setup(configure_search=False):
+    """Check the server, then create the persona (and optionally apply search settings concurrently)"""
+    
+    # One keep-alive client so the health check and API calls share a connection
+    async with httpx.AsyncClient(base_url=API_BASE) as client:
+        if not await check_health(client):
+            return False
+        if not configure_search:
+            return await create_persona(client)
+        # The two calls are independent, so overlap them; the settings
+        # update is best-effort and only the persona result decides success
+        created, _ = await asyncio.gather(
+            create_persona(client),
+            configure_search_settings(client),
+        )
+        return created
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a ChatGPT-like persona in Onyx")
+    parser.add_argument(
+        "--configure-search-settings",
+        action="store_true",
+        help="Also update the admin search settings (off by default)",
+    )
+    args = parser.parse_args()
+    
     print("🤖 Creating ChatGPT-like Persona in Onyx")
     print("=" * 40)
     print()
     
     # Create persona
-    if create_persona():
+    if asyncio.run(setup(args.configure_search_settings)):
         print()
         print("📝 Next steps:")
         print("1. Go to http://localhost:3000")